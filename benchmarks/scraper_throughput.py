@@ -0,0 +1,144 @@
+"""
+Benchmark the scraper (src/01_scrape_subreddit_comments.py) offline, against the Pushshift stand-in in
+mpx_pipeline/stand_in.py.
+
+For each fault profile, a stand-in server is started on a free local port with the same synthetic (or recorded) corpus,
+the scraper is run against it in a subprocess, and the following are reported:
+- comments/s: comments written divided by the scraper's wall-clock time
+- p50/p99 page latency: request latency percentiles from the scraper's own metrics
+- retries and 429s: from the scraper's own metrics
+- peak memory: the scraper's peak resident memory (Unix only)
+
+Run from the root of the repository:
+    python -m benchmarks.scraper_throughput --comments 50000 --subreddits 3
+    python -m benchmarks.scraper_throughput --profiles clean,hostile --shards 4 --output results.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from mpx_pipeline.sinks import iter_ndjson
+from mpx_pipeline.stand_in import Corpus, Faults, start_in_thread, synthetic_corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRAPER = os.path.join(ROOT, 'src', '01_scrape_subreddit_comments.py')
+
+SUBREDDITS = ['lgbt', 'gaymers', 'ainbow', 'askgaybros', 'asktransgender', 'MtF', 'NonBinary', 'ftm', 'BisexualTeens']
+
+# Fault profiles: keyword arguments for mpx_pipeline.stand_in.Faults
+PROFILES = {
+    'clean': {},
+    'latency': {'latency_ms': 50, 'jitter_ms': 25},
+    'throttled': {'throttle_rate': 0.10, 'retry_after': 0.5},
+    'flaky': {'error_rate': 0.05},
+    'hostile': {'latency_ms': 50, 'jitter_ms': 25, 'throttle_rate': 0.10, 'error_rate': 0.05},
+}
+
+
+def peak_memory_mb(metrics):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if metrics.get('peak_memory') is None:
+        return None
+    if sys.platform == 'darwin':
+        return metrics['peak_memory'] / 2 ** 20
+    return metrics['peak_memory'] / 2 ** 10
+
+
+def run_profile(name, corpus, subreddits, scraper_args):
+    """
+    Scrape `subreddits` from a stand-in server with the fault profile `name`, and return the measurements.
+    """
+    server, base_url = start_in_thread(corpus, Faults(seed=0, **PROFILES[name]))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            output_dir = os.path.join(tmp, 'comments')
+            metrics_file = os.path.join(tmp, 'metrics.json')
+            command = [sys.executable, SCRAPER] + subreddits + [
+                '--base-url', base_url, '--output-dir', output_dir, '--metrics-file', metrics_file] + scraper_args
+
+            # The scraper imports mpx_pipeline from the root of the repository
+            env = dict(os.environ)
+            env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+
+            started = time.perf_counter()
+            subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - started
+
+            comments = sum(1 for _ in iter_ndjson(output_dir))
+            with open(metrics_file) as file:
+                metrics = json.load(file)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    endpoint = metrics.get('/comment/search/', {})
+    return {
+        'profile': name,
+        'comments': comments,
+        'seconds': elapsed,
+        'comments_per_second': comments / elapsed,
+        'requests': endpoint.get('requests'),
+        'retries': endpoint.get('retries'),
+        'throttled': endpoint.get('throttled'),
+        'latency_p50_ms': endpoint['latency_p50'] * 1000 if endpoint.get('latency_p50') is not None else None,
+        'latency_p99_ms': endpoint['latency_p99'] * 1000 if endpoint.get('latency_p99') is not None else None,
+        'peak_memory_mb': peak_memory_mb(metrics),
+    }
+
+
+def format_value(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '%.1f' % value
+    return str(value)
+
+
+def print_table(rows):
+    columns = ['profile', 'comments', 'seconds', 'comments_per_second', 'requests', 'retries', 'throttled',
+               'latency_p50_ms', 'latency_p99_ms', 'peak_memory_mb']
+    widths = [max(len(column), *(len(format_value(row[column])) for row in rows)) for column in columns]
+    print('  '.join(column.rjust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(format_value(row[column]).rjust(width) for column, width in zip(columns, widths)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the scraper against an offline Pushshift stand-in.')
+    parser.add_argument('--profiles', default=','.join(PROFILES),
+                        help='comma-separated fault profiles to run: ' + ', '.join(PROFILES))
+    parser.add_argument('--corpus', default=None,
+                        help='NDJSON file or directory of recorded comments (default: synthetic comments)')
+    parser.add_argument('--comments', type=int, default=20000, help='number of synthetic comments')
+    parser.add_argument('--subreddits', type=int, default=3, help='number of synthetic subreddits')
+    parser.add_argument('--rate', type=float, default=1000.0,
+                        help="scraper's allowed requests per second, high so that pacing does not hide the scraper's "
+                             "own cost")
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--max-per-host', type=int, default=4)
+    parser.add_argument('--output', default=None, help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.corpus is not None:
+        comments = list(iter_ndjson(args.corpus))
+        subreddits = sorted({str(comment['subreddit']) for comment in comments})
+    else:
+        subreddits = SUBREDDITS[:args.subreddits]
+        comments = synthetic_corpus(args.comments, subreddits)
+    corpus = Corpus(comments)
+
+    scraper_args = ['--rate', str(args.rate), '--shards', str(args.shards), '--max-per-host', str(args.max_per_host)]
+
+    rows = []
+    for name in args.profiles.split(','):
+        rows.append(run_profile(name.strip(), corpus, subreddits, scraper_args))
+    print_table(rows)
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(rows, file, indent=2)
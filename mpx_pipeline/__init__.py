@@ -0,0 +1,3 @@
+# Shared code for the monkeypox Reddit pipeline scripts in src/
+
+from .ratelimit import RateLimiter, RetryError
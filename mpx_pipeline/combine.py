@@ -0,0 +1,178 @@
+"""
+The combine step of 05.1_combine_condensed_data.py: concatenate the subreddits' monkeypox comments (and their virus
+comments) written by the condense step (see mpx_pipeline/condense.py) into one file each.
+
+The subreddits' files all have the same columns, so the combined file is their header followed by each file's rows,
+copied as they are. Runs are incremental: combine_state.json next to the combined files keeps, for each combined file,
+its size and how far into each subreddit's file it has got, along with the generation of that file. The next run
+truncates the combined file back to its recorded size, in case the previous run was interrupted, and appends only what
+the condense step has appended since, so the combined file holds each refresh's new comments after the earlier ones.
+If a subreddit's file has been rebuilt since (its generation changed) or full=True, the combined file is rebuilt.
+
+When the condense step has written its partitioned dataset (see mpx_pipeline/dataset.py), nothing needs copying:
+readers read the partitions of the subreddits and the term set they want, and combine_dataset() only counts their rows
+from the Parquet footers.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+from .condense import OUTPUT_COLUMNS, OUTPUT_NAMES, load_state
+from .dataset import TERM_SETS, count_rows
+
+# Name of each combined file
+COMBINED_NAMES = {'mpx': 'all_subreddits_mpx_data.csv', 'virus': 'all_subreddits_virus_data.csv'}
+
+STATE_FILE = 'combine_state.json'
+
+
+def load_combine_state(output_dir):
+    """
+    Return the state of the last runs: kind ('mpx' or 'virus') -> the combined file's size in 'bytes', and for each
+    subreddit the generation of its file, the 'offset' combined up to and the 'rows' combined.
+    """
+    try:
+        with open(os.path.join(output_dir, STATE_FILE)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_combine_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(state, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _needs_rebuild(kind_state, combined_path, condensed, subreddits):
+    # Appending is only safe if everything combined so far is still there, unchanged
+    if kind_state is None or not os.path.exists(combined_path):
+        return True
+    if os.path.getsize(combined_path) < kind_state['bytes']:
+        return True
+    for subreddit in subreddits:
+        generation = condensed.get(subreddit, {}).get('generation')
+        done = kind_state['subreddits'].get(subreddit)
+        if generation is None:
+            # Written without a state, so there is no telling what changed
+            return True
+        if done is not None and done['generation'] != generation:
+            return True
+    return False
+
+
+def _count_rows(path):
+    # Only for files the condense step wrote without a state
+    return len(pd.read_csv(path, usecols=[0]))
+
+
+def combine(kind, subreddits, input_dir='.', output_dir='.', full=False):
+    """
+    Combine the subreddits' condensed files of one kind.
+
+    Parameters
+    ----------
+    kind: a string
+        'mpx' or 'virus'.
+    subreddits: a list
+        The subreddits, in the order their rows are added. Those without a file are left out.
+    input_dir: a string
+        Directory of the condense step's outputs.
+    output_dir: a string
+        Directory to write the combined file to.
+    full: a boolean
+        Rebuild the combined file from scratch.
+
+    Returns
+    -------
+    A dictionary with the combined file, whether it was rebuilt, and for each subreddit its total and new rows.
+    """
+    condensed = load_state(input_dir)
+    state = load_combine_state(output_dir)
+    combined_path = os.path.join(output_dir, COMBINED_NAMES[kind])
+    rebuild = full or _needs_rebuild(state.get(kind), combined_path, condensed, subreddits)
+    done = {} if rebuild else state[kind]['subreddits']
+
+    if rebuild:
+        write_path = combined_path + '.tmp'
+        combined = open(write_path, 'wb')
+        combined.write((','.join(OUTPUT_COLUMNS[kind]) + '\n').encode('utf-8'))
+    else:
+        write_path = combined_path
+        os.truncate(combined_path, state[kind]['bytes'])
+        combined = open(combined_path, 'ab')
+
+    results = []
+    try:
+        for subreddit in subreddits:
+            path = os.path.join(input_dir, OUTPUT_NAMES[kind].format(subreddit=subreddit))
+            if not os.path.exists(path):
+                continue
+            subreddit_state = condensed.get(subreddit, {})
+            # Only as far as the condense step has committed, not a run still writing
+            end = subreddit_state.get('bytes', {}).get(kind, os.path.getsize(path))
+            with open(path, 'rb') as file:
+                header = file.readline()
+                offset = done[subreddit]['offset'] if subreddit in done else len(header)
+                file.seek(offset)
+                remaining = end - offset
+                while remaining > 0:
+                    block = file.read(min(remaining, 1 << 20))
+                    if not block:
+                        break
+                    combined.write(block)
+                    remaining -= len(block)
+
+            rows = subreddit_state.get('rows', {}).get(kind)
+            if rows is None:
+                rows = _count_rows(path)
+            previous = done[subreddit]['rows'] if subreddit in done else 0
+            done[subreddit] = {'generation': subreddit_state.get('generation'), 'offset': end, 'rows': rows}
+            results.append({'subreddit': subreddit, 'rows': rows, 'new': rows - previous})
+
+        combined.flush()
+        os.fsync(combined.fileno())
+        combined.close()
+    except BaseException:
+        combined.close()
+        if rebuild:
+            os.remove(write_path)
+        raise
+
+    if rebuild:
+        os.replace(write_path, combined_path)
+    # The combined file is on disk before the state that refers to it
+    state[kind] = {'bytes': os.path.getsize(combined_path), 'subreddits': done}
+    save_combine_state(output_dir, state)
+    return {'kind': kind, 'output': combined_path, 'rebuilt': rebuild, 'subreddits': results,
+            'rows': sum(result['rows'] for result in results)}
+
+
+def combine_all(subreddits, input_dir='.', output_dir='.', full=False):
+    """
+    Combine the monkeypox and the virus files, see combine(). Returns a dictionary from kind to its result.
+    """
+    return {kind: combine(kind, subreddits, input_dir, output_dir, full) for kind in COMBINED_NAMES}
+
+
+def combine_dataset(subreddits, dataset_dir):
+    """
+    "Combine" the subreddits' monkeypox and virus comments in the partitioned dataset: count the rows of their
+    partitions, without reading or writing any comment.
+
+    Returns
+    -------
+    A dictionary from kind to the dataset, and for each subreddit its rows.
+    """
+    results = {}
+    for kind in COMBINED_NAMES:
+        counts = count_rows(dataset_dir, TERM_SETS[kind], subreddits)
+        rows = [{'subreddit': subreddit, 'rows': counts[subreddit]} for subreddit in subreddits if subreddit in counts]
+        results[kind] = {'kind': kind, 'output': dataset_dir, 'rebuilt': False, 'subreddits': rows,
+                         'rows': sum(result['rows'] for result in rows)}
+    return results
@@ -0,0 +1,196 @@
+"""
+The compact representation of the condensed comments written by the condense step (see mpx_pipeline/condense.py) and
+combined by the combine step (see mpx_pipeline/combine.py).
+
+Loaded with pd.read_csv, every text column of those files is a column of Python strings, the term flags are int64 and
+the ids are strings such as 't3_w1ddx3'. The compact representation instead keeps:
+    - subreddit, author and thread_title as categoricals: each distinct value once, and a small integer per row
+    - the term flags as booleans (bit-packed in Parquet)
+    - link_id and parent_id decoded to int64, with parent_is_submission telling the 't3_' parents from the 't1_' ones
+    - body and permalink as Arrow strings, if pyarrow is installed
+    - converted_createdutc as UTC date times, computed from created_utc instead of parsed
+
+load_condensed() reads a condensed .csv file a chunk at a time into the compact representation, so the Python strings
+of the whole file are never held at once, or reads the compact Parquet file written by write_compact() directly.
+expand() turns a compact DataFrame back into the columns of the .csv files.
+
+To write the compact Parquet file of each combined file:
+    python -m mpx_pipeline.compact all_subreddits_mpx_data.csv all_subreddits_virus_data.csv
+"""
+
+import argparse
+import os
+
+import pandas as pd
+
+from .seen import decode_id, encode_id
+
+# Optional dependency: pyarrow, for Arrow strings and the Parquet files
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Columns stored as categoricals
+CATEGORY_COLUMNS = ['subreddit', 'author', 'thread_title']
+
+# Columns of base-36 ids stored as int64
+ID_COLUMNS = ['link_id', 'parent_id']
+
+# Columns of free text
+STRING_COLUMNS = ['body', 'permalink']
+
+# Prefix of the ids of submissions
+SUBMISSION_PREFIX = 't3_'
+
+
+def is_flag(column):
+    """
+    Whether a column is a term flag, e.g. contains_monkeypox_term.
+    """
+    return column.startswith('contains_') and column.endswith('_term')
+
+
+def compact_path(path):
+    """
+    The compact Parquet file of a condensed .csv file, e.g. all_subreddits_mpx_data.parquet.
+    """
+    return path[:-len('.csv')] + '.parquet' if path.endswith('.csv') else path + '.parquet'
+
+
+def decode_ids(ids):
+    """
+    Decode a column of base-36 ids (with or without prefix) into nullable int64, decoding each distinct id once.
+    """
+    codes, uniques = pd.factorize(ids)
+    decoded = pd.array([decode_id(reddit_id) for reddit_id in uniques], dtype='Int64')
+    return pd.Series(decoded.take(codes, allow_fill=True), index=ids.index, dtype='Int64')
+
+
+def encode_ids(numbers, prefix):
+    """
+    Encode a column of int64 ids back into base-36 ids with a prefix, one per row or one for the whole column.
+    """
+    text = numbers.map(encode_id, na_action='ignore')
+    return (prefix + text).where(numbers.notna())
+
+
+def compact(data):
+    """
+    Convert a chunk of condensed comments, as read from a .csv file, into the compact representation. Columns the
+    compact representation does not know of are left as they are.
+    """
+    data = data.copy()
+    for column in CATEGORY_COLUMNS:
+        if column in data:
+            data[column] = data[column].astype('category')
+    for column in data.columns:
+        if is_flag(column):
+            # A missing flag is False, not True as astype(bool) would make it
+            data[column] = data[column].fillna(False).astype(bool)
+    if 'parent_id' in data:
+        data.insert(data.columns.get_loc('parent_id') + 1, 'parent_is_submission',
+                    data['parent_id'].str.startswith(SUBMISSION_PREFIX).fillna(False).astype(bool))
+    for column in ID_COLUMNS:
+        if column in data:
+            data[column] = decode_ids(data[column])
+    for column in ['created_utc', 'retrieved_utc']:
+        if column in data:
+            data[column] = pd.to_numeric(data[column], errors='coerce').astype('Int64')
+    if 'converted_createdutc' in data:
+        # The same date times as the text, without parsing it
+        if 'created_utc' in data:
+            data['converted_createdutc'] = pd.to_datetime(data['created_utc'].astype('float64'), unit='s', utc=True)
+        else:
+            data['converted_createdutc'] = pd.to_datetime(data['converted_createdutc'], utc=True, format='ISO8601')
+    if pa is not None:
+        for column in STRING_COLUMNS:
+            if column in data:
+                data[column] = data[column].astype('string[pyarrow]')
+    return data
+
+
+def concat_compact(frames):
+    """
+    Concatenate compact DataFrames, merging the categories of their categorical columns so that they stay
+    categoricals.
+    """
+    if not frames:
+        return pd.DataFrame()
+    data = pd.concat(frames, ignore_index=True)
+    for column in CATEGORY_COLUMNS:
+        if column in data and not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = pd.Series(pd.api.types.union_categoricals([frame[column] for frame in frames]),
+                                     index=data.index)
+    return data
+
+
+def expand(data):
+    """
+    Convert compact condensed comments back into the columns and values of the .csv files.
+    """
+    data = data.copy()
+    if 'link_id' in data:
+        data['link_id'] = encode_ids(data['link_id'], SUBMISSION_PREFIX)
+    if 'parent_id' in data:
+        parent_id = encode_ids(data['parent_id'], 't1_')
+        if 'parent_is_submission' in data:
+            submission = data['parent_is_submission'] & data['parent_id'].notna()
+            parent_id[submission] = encode_ids(data['parent_id'][submission], SUBMISSION_PREFIX)
+        data['parent_id'] = parent_id
+    data = data.drop(columns=['parent_is_submission'], errors='ignore')
+    for column in data.columns:
+        if is_flag(column):
+            data[column] = data[column].astype('int64')
+        elif column in CATEGORY_COLUMNS or column in STRING_COLUMNS:
+            data[column] = data[column].astype(object)
+    return data
+
+
+def load_condensed(path, columns=None, chunk_rows=100000):
+    """
+    Load condensed comments in the compact representation.
+
+    Parameters
+    ----------
+    path: a string
+        A condensed .csv file, e.g. all_subreddits_mpx_data.csv, or its compact Parquet file.
+    columns: a list
+        The columns to load, e.g. ['author', 'body']. Defaults to all of them.
+    chunk_rows: an integer
+        Number of rows of a .csv file parsed at a time.
+
+    Returns
+    -------
+    A DataFrame of the compact representation.
+    """
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    chunks = pd.read_csv(path, usecols=columns, chunksize=chunk_rows,
+                         dtype={column: str for column in CATEGORY_COLUMNS + ID_COLUMNS + STRING_COLUMNS})
+    return concat_compact([compact(chunk) for chunk in chunks])
+
+
+def write_compact(data, path, compression='zstd'):
+    """
+    Write compact condensed comments to a Parquet file, which keeps the categoricals dictionary-encoded and the flags
+    bit-packed. Needs pyarrow.
+    """
+    if pa is None:
+        raise ImportError('writing ' + path + ' needs pyarrow: pip install pyarrow')
+    temp_path = path + '.tmp'
+    data.to_parquet(temp_path, engine='pyarrow', compression=compression, index=False)
+    os.replace(temp_path, path)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the compact Parquet file of condensed .csv files.')
+    parser.add_argument('paths', nargs='+', help='condensed .csv files, e.g. all_subreddits_mpx_data.csv')
+    parser.add_argument('--chunk-rows', type=int, default=100000, help='number of rows parsed at a time')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        data = load_condensed(path, chunk_rows=args.chunk_rows)
+        print('Wrote', len(data), 'rows,', '%.1f MB in memory,' % (data.memory_usage(deep=True).sum() / 1e6),
+              'to', write_compact(data, compact_path(path)))
@@ -0,0 +1,510 @@
+"""
+The condense step of 04.1_condense_data.py: from each subreddit's comments, keep the columns the analysis uses, add the
+UTC creation time and the thread title, flag the monkeypox and virus terms, and write the condensed, monkeypox and
+virus comments to .csv files.
+
+The comments are streamed from the subreddit's Parquet file (see mpx_pipeline/convert.py) a chunk of rows at a time,
+and each chunk is appended to the three outputs once it has been condensed, so memory use depends on the chunk size
+and not on the size of the subreddit. Every output is written to a temporary file and moved into place once the
+subreddit is done.
+
+The work is split into tasks of a few Parquet row groups each, which can be spread over a process pool. Each worker
+reads its row groups straight from the Parquet file, so no comments are sent between processes, and sends back its
+rows already encoded as .csv text. The parent writes the tasks' text in their original order, so the outputs are
+byte-identical whatever the number of processes.
+
+Runs are incremental. condense_state.json in the output directory keeps, for each subreddit, a watermark (the
+created_utc and id of the newest comment condensed so far), the size of each output, and the number of rows in it. The
+next run truncates the outputs back to those sizes, in case the previous run was interrupted, skips the row groups
+that end before the watermark, and appends only the comments past it. A full rebuild (full=True) starts the
+subreddit's outputs over and gives them a new generation, which tells the combine step (see mpx_pipeline/combine.py)
+to start over too. Comments created before the watermark that only arrive in a later scrape, e.g. from a
+backfill or a late Pushshift ingest, are left out by incremental runs until a full rebuild.
+
+The condensed, mpx and virus comments are also written, in their compact representation, to a dataset partitioned by
+subreddit, term set and month (see mpx_pipeline/dataset.py), which readers open lazily instead of loading the .csv
+files. Each run's files are named after the subreddit's generation and run, and published once its state is saved.
+"""
+
+import collections
+import io
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from . import dataset as condensed_dataset
+from .seen import decode_id, encode_id
+from .terms import CLASSIFIER
+from .titles import TitleIndex, permalink_titles
+
+# Optional dependency: pyarrow, to read the Parquet files a chunk at a time
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# The nine subreddits, in the order of the analysis
+SUBREDDITS = ['lgbt', 'gaymers', 'ainbow', 'askgaybros', 'asktransgender', 'MtF', 'NonBinary', 'ftm', 'BisexualTeens']
+
+# The columns kept from the comments
+INPUT_COLUMNS = ['author', 'body', 'subreddit', 'created_utc', 'retrieved_utc', 'permalink', 'link_id', 'parent_id']
+
+# The columns of each output, in the order 04.1_condense_data.py has always written them
+OUTPUT_COLUMNS = {
+    'condensed': INPUT_COLUMNS + ['converted_createdutc', 'thread_title', 'contains_monkeypox_term',
+                                  'contains_virus_term'],
+    'mpx': INPUT_COLUMNS + ['converted_createdutc', 'thread_title', 'contains_monkeypox_term',
+                            'contains_epoxy_term'],
+    'virus': INPUT_COLUMNS + ['converted_createdutc', 'thread_title', 'contains_monkeypox_term',
+                              'contains_virus_term'],
+}
+
+STATE_FILE = 'condense_state.json'
+
+# Names of the input and outputs of a subreddit
+INPUT_NAME = '{subreddit}_subreddit_comments_all.parquet'
+OUTPUT_NAMES = {
+    'condensed': '{subreddit}_subreddit_condensed_data.csv',
+    'mpx': '{subreddit}_subreddit_mpx_data.csv',
+    'virus': '{subreddit}_subreddit_virus_data.csv',
+}
+
+
+def convert_epoch(epoch_times):
+    """
+    Convert a whole column of epoch times into UTC date times in one pass. Strings of numbers are parsed, and anything
+    that is not a number (NaN, "TRUE", "FALSE") becomes NaT.
+    """
+    seconds = pd.to_numeric(epoch_times, errors='coerce')
+    return pd.to_datetime(seconds, unit='s', utc=True)
+
+
+def thread_titles(data, titles):
+    """
+    The title of each comment's thread: the real title from `titles` (a TitleIndex) by link_id, otherwise the title
+    in the permalink, otherwise 'nan'.
+    """
+    thread_title = titles.join(data['link_id'])
+    missing = thread_title.isna()
+    thread_title[missing] = permalink_titles(data['permalink'][missing])
+    return thread_title.fillna('nan')
+
+
+def condense_chunk(data, titles):
+    """
+    Condense a chunk of comments.
+
+    Parameters
+    ----------
+    data: a DataFrame
+        Comments with the INPUT_COLUMNS.
+    titles: a TitleIndex
+        Real thread titles, possibly empty.
+
+    Returns
+    -------
+    A dictionary with the 'condensed', 'mpx' and 'virus' DataFrames of the chunk, with their OUTPUT_COLUMNS.
+    """
+    data = data[INPUT_COLUMNS].reset_index(drop=True)
+    data['converted_createdutc'] = convert_epoch(data['created_utc'])
+    data['thread_title'] = thread_titles(data, titles)
+
+    # One scan of each body and title for every term, see mpx_pipeline/terms.py
+    flags = CLASSIFIER.classify_column(data['body'], data['thread_title'])
+    data['contains_monkeypox_term'] = flags['contains_monkeypox_term']
+    data['contains_virus_term'] = flags['contains_virus_term']
+
+    # Monkeypox comments, without those that mention 'epoxy'
+    mpx = data.loc[data['contains_monkeypox_term'] == 1, OUTPUT_COLUMNS['mpx'][:-1]].copy()
+    mpx['contains_epoxy_term'] = flags['contains_epoxy_term'][mpx.index]
+    mpx = mpx.loc[mpx['contains_epoxy_term'] == 0]
+
+    virus = data.loc[data['contains_virus_term'] == 1, OUTPUT_COLUMNS['virus']]
+    return {'condensed': data[OUTPUT_COLUMNS['condensed']], 'mpx': mpx, 'virus': virus}
+
+
+Task = collections.namedtuple('Task', ['subreddit', 'path', 'row_groups', 'watermark'])
+
+
+def plan_tasks(subreddit, path, chunk_rows=100000, watermark=None):
+    """
+    Split a subreddit's Parquet file into tasks of consecutive row groups holding about `chunk_rows` rows each,
+    leaving out the row groups whose created_utc statistics show they end before the watermark.
+    """
+    if pq is None:
+        raise ImportError('reading ' + path + ' a chunk at a time needs pyarrow: pip install pyarrow')
+    file = pq.ParquetFile(path)
+    metadata = file.metadata
+    column = file.schema_arrow.get_field_index('created_utc')
+    tasks = []
+    row_groups = []
+    rows = 0
+    for i in range(metadata.num_row_groups):
+        if watermark is not None:
+            statistics = metadata.row_group(i).column(column).statistics
+            if statistics is not None and statistics.has_min_max and statistics.max < watermark[0]:
+                continue
+        row_groups.append(i)
+        rows += metadata.row_group(i).num_rows
+        if rows >= chunk_rows:
+            tasks.append(Task(subreddit, path, row_groups, watermark))
+            row_groups = []
+            rows = 0
+    if row_groups:
+        tasks.append(Task(subreddit, path, row_groups, watermark))
+    return tasks
+
+
+def past_watermark(chunk, watermark):
+    """
+    Keep the comments of a chunk that are newer than the watermark (created_utc, decoded id).
+    """
+    created_utc = chunk['created_utc']
+    keep = created_utc > watermark[0]
+    tie = created_utc == watermark[0]
+    if tie.any():
+        keep[tie] = chunk.loc[tie, 'id'].map(decode_id) > watermark[1]
+    return chunk[keep]
+
+
+def newest(chunk):
+    """
+    The watermark of a chunk's newest comment: its created_utc and decoded id.
+    """
+    latest = chunk['created_utc'].max()
+    return int(latest), max(chunk.loc[chunk['created_utc'] == latest, 'id'].map(decode_id))
+
+
+def condense_task(task, chunk_rows, titles, dataset=None):
+    """
+    Condense a task's row groups, at most `chunk_rows` rows at a time, leaving out the comments up to its watermark.
+    With a dataset (its directory and the run's prefix, see mpx_pipeline/dataset.py), the outputs are also written to
+    the dataset's unpublished files.
+
+    Returns
+    -------
+    The number of comments condensed, a dictionary with the .csv text (without header) and the number of rows of
+    each output, and the watermark of the newest comment condensed (None if there were none).
+    """
+    buffers = {name: io.StringIO() for name in OUTPUT_NAMES}
+    counts = dict.fromkeys(OUTPUT_NAMES, 0)
+    rows = 0
+    watermark = None
+    file = pq.ParquetFile(task.path)
+    batches = file.iter_batches(batch_size=chunk_rows, row_groups=task.row_groups, columns=INPUT_COLUMNS + ['id'])
+    for i, batch in enumerate(batches):
+        chunk = batch.to_pandas()
+        if task.watermark is not None:
+            chunk = past_watermark(chunk, task.watermark)
+        if len(chunk) == 0:
+            continue
+        for name, data in condense_chunk(chunk, titles).items():
+            data.to_csv(buffers[name], header=False, index=False)
+            counts[name] += len(data)
+            if dataset is not None:
+                condensed_dataset.write_parts(dataset[0], task.subreddit, name, data, dataset[1], task.row_groups[0],
+                                              i)
+        rows += len(chunk)
+        watermark = max(watermark, newest(chunk)) if watermark is not None else newest(chunk)
+    return rows, {name: (buffers[name].getvalue(), counts[name]) for name in OUTPUT_NAMES}, watermark
+
+
+# The thread titles of a worker process, set once when it starts
+_worker_titles = None
+
+
+def _init_worker(titles):
+    global _worker_titles
+    _worker_titles = titles
+    # The processes are the parallelism: one Arrow thread each keeps them from competing for the cores
+    pa.set_cpu_count(1)
+
+
+def _run_task(task, chunk_rows, dataset):
+    return condense_task(task, chunk_rows, _worker_titles, dataset)
+
+
+class CSVAppender:
+    """
+    Appends .csv text to a file with a fixed header.
+
+    A new file is written to a temporary file that replaces the file on close(). An existing file is appended to in
+    place from `size` bytes (anything after is left over from an interrupted run and is truncated), and abort()
+    truncates it back.
+    """
+
+    def __init__(self, path, columns, size=None):
+        self.path = path
+        self.rows = 0
+        if size is None:
+            self.temp_path = path + '.tmp'
+            self.file = open(self.temp_path, 'w', newline='', encoding='utf-8')
+            self.file.write(','.join(columns) + '\n')
+        else:
+            self.temp_path = None
+            self.size = size
+            os.truncate(path, size)
+            self.file = open(path, 'a', newline='', encoding='utf-8')
+
+    def append(self, text, rows):
+        self.file.write(text)
+        self.rows += rows
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        if self.temp_path is not None:
+            os.replace(self.temp_path, self.path)
+        return os.path.getsize(self.path)
+
+    def abort(self):
+        self.file.close()
+        if self.temp_path is not None:
+            os.remove(self.temp_path)
+        else:
+            os.truncate(self.path, self.size)
+
+
+class SubredditOutputs:
+    """
+    The condensed, mpx and virus outputs of one subreddit, and its state (see load_state()).
+
+    Parameters
+    ----------
+    subreddit: a string
+        The subreddit.
+    output_dir: a string
+        Directory of the outputs.
+    state: a dictionary
+        The subreddit's state from the last run, to append to. None to start the outputs over.
+    dataset_dir: a string
+        Directory of the partitioned dataset (see mpx_pipeline/dataset.py) to write to as well, if any.
+    """
+
+    def __init__(self, subreddit, output_dir, state=None, dataset_dir=None):
+        self.subreddit = subreddit
+        self.rows = 0
+        self.watermark = None
+        if state is None:
+            state = {'generation': uuid.uuid4().hex, 'created_utc': None, 'id': None,
+                     'rows': dict.fromkeys(['comments'] + list(OUTPUT_NAMES), 0), 'bytes': {}}
+        self.state = state
+        self.run = state.get('run', 0) + 1
+        self.dataset = None
+        if dataset_dir is not None:
+            self.dataset = (dataset_dir, condensed_dataset.run_prefix(state['generation'], self.run))
+        self.writers = {}
+        for name, pattern in OUTPUT_NAMES.items():
+            self.writers[name] = CSVAppender(os.path.join(output_dir, pattern.format(subreddit=subreddit)),
+                                             OUTPUT_COLUMNS[name], state['bytes'].get(name))
+
+    def append(self, result):
+        rows, outputs, watermark = result
+        for name, (text, count) in outputs.items():
+            self.writers[name].append(text, count)
+        self.rows += rows
+        if watermark is not None and (self.watermark is None or watermark > self.watermark):
+            self.watermark = watermark
+
+    def close(self):
+        """
+        Close the outputs and return the subreddit's new state, and the rows condensed in this run.
+        """
+        state = dict(self.state, rows=dict(self.state['rows']), bytes={})
+        state['rows']['comments'] += self.rows
+        for name, writer in self.writers.items():
+            state['bytes'][name] = writer.close()
+            state['rows'][name] += writer.rows
+        if self.watermark is not None:
+            state['created_utc'], state['id'] = self.watermark[0], encode_id(self.watermark[1])
+        state['run'] = self.run
+        state['dataset'] = self.dataset is not None
+        if self.dataset is not None:
+            condensed_dataset.publish(self.dataset[0], self.subreddit, self.dataset[1])
+        new = dict({'comments': self.rows}, **{name: writer.rows for name, writer in self.writers.items()})
+        return state, new
+
+    def clean(self):
+        """
+        Remove the dataset's files that the state saved after close() no longer refers to, e.g. those of the
+        generation before a full rebuild.
+        """
+        if self.dataset is not None:
+            condensed_dataset.clean(self.dataset[0], self.subreddit, self.state['generation'], self.run)
+
+    def abort(self):
+        for writer in self.writers.values():
+            writer.abort()
+        if self.dataset is not None:
+            condensed_dataset.discard(self.dataset[0], self.subreddit, self.dataset[1])
+
+
+def load_state(output_dir):
+    """
+    Return the state of the last runs in an output directory: subreddit -> its generation, watermark (created_utc and
+    id), the rows and bytes of each output, the number of runs and whether they all wrote the dataset.
+    """
+    try:
+        with open(os.path.join(output_dir, STATE_FILE)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(state, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _resumable(state, subreddit, output_dir, dataset_dir=None):
+    # Appending needs the subreddit's state and every output it refers to
+    if subreddit not in state:
+        return False
+    if dataset_dir is not None and not state[subreddit].get('dataset'):
+        return False
+    for name, pattern in OUTPUT_NAMES.items():
+        path = os.path.join(output_dir, pattern.format(subreddit=subreddit))
+        if name not in state[subreddit]['bytes'] or not os.path.exists(path):
+            return False
+        if os.path.getsize(path) < state[subreddit]['bytes'][name]:
+            return False
+    return True
+
+
+def _ordered_results(tasks, chunk_rows, titles, workers, datasets):
+    # Yield (task, result) in the order of the tasks, running up to 2 tasks per worker ahead of the one written
+    if workers <= 1:
+        for task in tasks:
+            yield task, condense_task(task, chunk_rows, titles, datasets[task.subreddit])
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(titles,)) as pool:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append((task, pool.submit(_run_task, task, chunk_rows, datasets[task.subreddit])))
+            if len(pending) >= 2 * workers:
+                task, future = pending.popleft()
+                yield task, future.result()
+        while pending:
+            task, future = pending.popleft()
+            yield task, future.result()
+
+
+def condense_subreddits(subreddits, titles=None, input_dir='.', output_dir='.', chunk_rows=100000, workers=1,
+                        full=False, dataset_dir=None):
+    """
+    Condense subreddits' comments, a chunk at a time, over `workers` processes, appending the comments past each
+    subreddit's watermark to its outputs.
+
+    Parameters
+    ----------
+    subreddits: a list
+        The subreddits, e.g. ['lgbt'].
+    titles: a TitleIndex
+        Real thread titles. Defaults to none, i.e. titles from the permalinks.
+    input_dir: a string
+        Directory with the <subreddit>_subreddit_comments_all.parquet files.
+    output_dir: a string
+        Directory to write the condensed, mpx and virus .csv files to.
+    chunk_rows: an integer
+        Number of comments condensed at a time, and the size of a task.
+    workers: an integer
+        Number of processes. 1 condenses in this process.
+    full: a boolean
+        Condense every comment again and start the outputs over, instead of appending the new comments.
+    dataset_dir: a string
+        Directory of the partitioned dataset to write the outputs to as well (see mpx_pipeline/dataset.py). None to
+        only write the .csv files.
+
+    Returns
+    -------
+    A list with each subreddit's state (see load_state()), with the rows condensed in this run in 'new'.
+    """
+    titles = titles if titles is not None else TitleIndex()
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_state(output_dir)
+
+    tasks = []
+    remaining = {}
+    outputs = {}
+    new = {}
+    try:
+        for subreddit in subreddits:
+            resume = not full and _resumable(state, subreddit, output_dir, dataset_dir)
+            watermark = None
+            if resume and state[subreddit]['created_utc'] is not None:
+                watermark = (state[subreddit]['created_utc'], decode_id(state[subreddit]['id']))
+            if resume and dataset_dir is not None:
+                # Files of a run that was interrupted
+                condensed_dataset.clean(dataset_dir, subreddit, state[subreddit]['generation'],
+                                        state[subreddit]['run'])
+            subreddit_tasks = plan_tasks(subreddit, os.path.join(input_dir, INPUT_NAME.format(subreddit=subreddit)),
+                                         chunk_rows, watermark)
+            tasks.extend(subreddit_tasks)
+            remaining[subreddit] = len(subreddit_tasks)
+            outputs[subreddit] = SubredditOutputs(subreddit, output_dir, state[subreddit] if resume else None,
+                                                  dataset_dir)
+        datasets = {subreddit: output.dataset for subreddit, output in outputs.items()}
+
+        def finish(subreddit):
+            # The outputs are on disk before the state that refers to them
+            output = outputs.pop(subreddit)
+            state[subreddit], new[subreddit] = output.close()
+            save_state(output_dir, state)
+            output.clean()
+
+        # A subreddit with nothing new only gets its headers, or is left as it is
+        for subreddit in subreddits:
+            if remaining[subreddit] == 0:
+                finish(subreddit)
+        for task, result in _ordered_results(tasks, chunk_rows, titles, workers, datasets):
+            outputs[task.subreddit].append(result)
+            remaining[task.subreddit] -= 1
+            if remaining[task.subreddit] == 0:
+                finish(task.subreddit)
+    except BaseException:
+        for output in outputs.values():
+            output.abort()
+        raise
+    return [dict(state[subreddit], subreddit=subreddit, new=new[subreddit]) for subreddit in subreddits]
+
+
+def condense_subreddit(subreddit, titles=None, input_dir='.', output_dir='.', chunk_rows=100000, workers=1,
+                       full=False, dataset_dir=None):
+    """
+    Condense one subreddit's comments, see condense_subreddits().
+    """
+    return condense_subreddits([subreddit], titles, input_dir, output_dir, chunk_rows, workers, full, dataset_dir)[0]
+
+
+def load_titles(path='submissions'):
+    """
+    Load the real thread titles from the scraped submissions, or return an empty index if there are none.
+    """
+    if os.path.exists(path):
+        return TitleIndex.from_ndjson(path)
+    return TitleIndex()
+
+
+def condense_all(subreddits=SUBREDDITS, input_dir='.', output_dir='.', chunk_rows=100000, titles_path='submissions',
+                 workers=1, full=False, dataset=True):
+    """
+    Condense several subreddits in one run, sharing the thread titles and the process pool. With `dataset`, the
+    outputs are also written to the partitioned dataset in output_dir/condensed_comments.
+
+    Returns
+    -------
+    A list with the result of condense_subreddits() for each subreddit.
+    """
+    titles = load_titles(titles_path)
+    dataset_dir = os.path.join(output_dir, condensed_dataset.DATASET_NAME) if dataset else None
+    return condense_subreddits(subreddits, titles, input_dir, output_dir, chunk_rows, workers, full, dataset_dir)
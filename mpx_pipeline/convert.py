@@ -0,0 +1,311 @@
+"""
+Conversion of the scraper's NDJSON output into typed, compressed columnar files (Parquet or Feather) for the later
+stages of the pipeline.
+
+The input is read a chunk of rows at a time and each chunk is written as one Parquet row group (or one Feather record
+batch), so memory use depends on the chunk size and not on the size of the input. The input can be anything
+mpx_pipeline.sinks.iter_ndjson reads: a plain, gzip or zstd NDJSON file, or a directory of them such as one
+subreddit's partitions.
+
+With a declared schema (see mpx_pipeline/schema.py), every chunk is coerced to the schema's types a column at a time,
+and the rows that do not match it are written to a quarantine NDJSON file next to the output instead.
+
+The output is written to a temporary file next to it and moved into place once it is complete, so an interrupted
+conversion never leaves a truncated file behind. A manifest with its row count and created_utc range is written next
+to it (see mpx_pipeline/manifest.py).
+
+convert_all() converts every subreddit's dump in a directory at once, one conversion per process, and writes a summary
+of them.
+"""
+
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .manifest import TimeRange, write_manifest
+from .schema import arrow_schema, coerce
+from .sinks import NDJSONFile, iter_ndjson, ndjson_files
+
+# Optional dependency: pyarrow for Parquet and Feather
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# File extension for each output format
+FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+
+# Name of each subreddit's output in convert_all(), as the later scripts expect it
+OUTPUT_NAME = '{subreddit}_subreddit_comments_all'
+
+SUMMARY_FILE = 'conversion_summary.json'
+
+
+def output_format(path):
+    """
+    Return the format ('parquet' or 'feather') of an output file, going by its extension.
+    """
+    for format, extension in FORMATS.items():
+        if path.endswith(extension):
+            return format
+    raise ValueError('cannot tell the format of %s, expected one of %s' % (path, ', '.join(FORMATS.values())))
+
+
+def iter_chunks(path, chunk_rows=100000):
+    """
+    Yield the objects in an NDJSON file or directory (see iter_ndjson) as lists of at most `chunk_rows` objects.
+    """
+    chunk = []
+    for obj in iter_ndjson(path):
+        chunk.append(obj)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def infer_schema(chunk):
+    """
+    Infer an Arrow schema from a chunk of objects. Columns that are null throughout the chunk are typed as strings,
+    so that later chunks with values in them can still be written.
+    """
+    schema = pa.Table.from_pylist(chunk).schema
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+
+class ColumnarWriter:
+    """
+    Writes Arrow tables to a Parquet or Feather file, one row group or record batch per table.
+
+    Parameters
+    ----------
+    path: a string
+        Output file.
+    schema: a pyarrow.Schema
+        Schema of every table written.
+    format: a string
+        'parquet' or 'feather'. Defaults to the format of the path's extension.
+    compression: a string
+        Compression codec, e.g. 'zstd', 'lz4' or 'snappy'. None for no compression.
+    """
+
+    def __init__(self, path, schema, format=None, compression='zstd'):
+        if pa is None:
+            raise ImportError('writing Parquet or Feather needs pyarrow: pip install pyarrow')
+        self.format = format or output_format(path)
+        if self.format == 'parquet':
+            self.writer = pq.ParquetWriter(path, schema, compression=compression or 'none')
+        elif self.format == 'feather':
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            self.writer = pa.ipc.new_file(path, schema, options=options)
+        else:
+            raise ValueError('unknown output format: ' + str(self.format))
+
+    def write(self, table):
+        if self.format == 'parquet':
+            self.writer.write_table(table, row_group_size=table.num_rows)
+        else:
+            self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+def quarantine_path(output_path):
+    """
+    The quarantine file of an output: the rows that did not match the schema, e.g. comments.parquet.quarantine.ndjson.
+    """
+    return output_path + '.quarantine.ndjson'
+
+
+def convert(input_path, output_path, format=None, chunk_rows=100000, compression='zstd', schema=None):
+    """
+    Convert NDJSON objects into a Parquet or Feather file, a chunk at a time.
+
+    Parameters
+    ----------
+    input_path: a string
+        NDJSON file or directory, plain or compressed.
+    output_path: a string
+        Parquet or Feather file to write. Replaced if it exists.
+    format: a string
+        'parquet' or 'feather'. Defaults to the format of the output path's extension.
+    chunk_rows: an integer
+        Number of rows read into memory and written at a time.
+    compression: a string
+        Compression codec of the output, see ColumnarWriter.
+    schema: a list
+        Declared schema of the output, e.g. mpx_pipeline.schema.COMMENT_SCHEMA. Fields that are not in it are left
+        out, and rows that do not match it are written to quarantine_path(output_path). Defaults to the schema
+        inferred from the first chunk (see infer_schema), without coercion.
+
+    Returns
+    -------
+    A dictionary with the output path, its format, and the number of rows and chunks written and quarantined.
+    """
+    if pa is None:
+        raise ImportError('writing Parquet or Feather needs pyarrow: pip install pyarrow')
+    format = format or output_format(output_path)
+    temp_path = output_path + '.tmp'
+    arrow = arrow_schema(schema) if schema is not None else None
+
+    # The quarantine file only holds the rows of the latest conversion, and only exists if there are any
+    quarantine = NDJSONFile(quarantine_path(output_path))
+    if os.path.exists(quarantine.path):
+        os.remove(quarantine.path)
+
+    writer = None
+    rows = 0
+    chunks = 0
+    quarantined = 0
+    time_range = TimeRange()
+    try:
+        for chunk in iter_chunks(input_path, chunk_rows):
+            if schema is not None:
+                data, bad = coerce(chunk, schema)
+                table = pa.Table.from_pandas(data, schema=arrow, preserve_index=False)
+                for row in bad:
+                    quarantine.write(row)
+                quarantined += len(bad)
+            else:
+                if arrow is None:
+                    arrow = infer_schema(chunk)
+                table = pa.Table.from_pylist(chunk, schema=arrow)
+            if writer is None:
+                writer = ColumnarWriter(temp_path, arrow, format, compression)
+            # Every row of the chunk may have been quarantined, and Parquet has no empty row groups
+            if table.num_rows == 0:
+                continue
+            writer.write(table)
+            time_range.update(table)
+            rows += table.num_rows
+            chunks += 1
+
+        # An empty input still makes a valid, empty file
+        if writer is None:
+            arrow = arrow if arrow is not None else pa.schema([])
+            writer = ColumnarWriter(temp_path, arrow, format, compression)
+        writer.close()
+        writer = None
+        quarantine.close()
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, output_path)
+    write_manifest(output_path, format, rows, arrow, time_range.min, time_range.max, quarantined=quarantined)
+    return {'output': output_path, 'format': format, 'rows': rows, 'chunks': chunks, 'quarantined': quarantined}
+
+
+def find_dumps(root):
+    """
+    Find every subreddit's dump in a directory: the scraper's partitions (subreddit=<name> directories) and single
+    NDJSON files, plain or compressed, named after their subreddit (e.g. lgbt.json or lgbt.ndjson.zst).
+
+    Returns
+    -------
+    A dictionary from subreddit to the path of its dump, in sorted order.
+    """
+    dumps = {}
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and name.startswith('subreddit='):
+            dumps[name[len('subreddit='):]] = path
+        elif name.endswith(('.quarantine.ndjson', '.manifest.json')) or name == SUMMARY_FILE:
+            # Written by an earlier conversion, not a dump
+            continue
+        elif os.path.isfile(path) and re.search(r'\.(nd)?json(\.gz|\.zst)?$', name):
+            dumps[re.sub(r'\.(nd)?json(\.gz|\.zst)?$', '', name)] = path
+    return dumps
+
+
+def dump_size(path):
+    """
+    Size in bytes of a dump, file or directory.
+    """
+    return sum(os.path.getsize(file_path) for file_path in ndjson_files(path))
+
+
+def _convert_one(subreddit, input_path, output_path, kwargs):
+    # Runs in a worker process
+    started = time.monotonic()
+    result = convert(input_path, output_path, **kwargs)
+    result.update({
+        'subreddit': subreddit,
+        'input': input_path,
+        'input_bytes': dump_size(input_path),
+        'output_bytes': os.path.getsize(output_path),
+        'seconds': round(time.monotonic() - started, 3),
+    })
+    return result
+
+
+def convert_all(root, output_dir='.', format='parquet', workers=None, output_name=OUTPUT_NAME, **kwargs):
+    """
+    Convert every subreddit's dump in a directory (see find_dumps) in parallel, one conversion per process.
+
+    The biggest dumps are started first, so that with enough workers the whole batch takes about as long as the
+    biggest dump on its own.
+
+    Parameters
+    ----------
+    root: a string
+        Directory holding the dumps, e.g. the scraper's "comments" directory.
+    output_dir: a string
+        Directory to write the outputs and the summary to.
+    format: a string
+        'parquet' or 'feather'.
+    workers: an integer
+        Number of processes. Defaults to the number of CPUs (and never more than the number of dumps).
+    output_name: a string
+        Name of each output without its extension, with {subreddit} in it.
+    kwargs:
+        Passed on to convert(), e.g. chunk_rows, compression or schema.
+
+    Returns
+    -------
+    The summary: one entry per subreddit, in sorted order, with its output, rows, quarantined rows, sizes and time,
+    and the totals. It is also written to conversion_summary.json in the output directory.
+    """
+    dumps = find_dumps(root)
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = sorted(dumps.items(), key=lambda item: dump_size(item[1]), reverse=True)
+    started = time.monotonic()
+    results = {}
+    if jobs:
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for subreddit, input_path in jobs:
+                output_path = os.path.join(output_dir, output_name.format(subreddit=subreddit) + FORMATS[format])
+                futures[subreddit] = pool.submit(_convert_one, subreddit, input_path, output_path,
+                                                 dict(kwargs, format=format))
+            for subreddit, future in futures.items():
+                results[subreddit] = future.result()
+
+    subreddits = [results[subreddit] for subreddit in sorted(results)]
+    summary = {
+        'subreddits': subreddits,
+        'total': {
+            'rows': sum(result['rows'] for result in subreddits),
+            'quarantined': sum(result['quarantined'] for result in subreddits),
+            'input_bytes': sum(result['input_bytes'] for result in subreddits),
+            'output_bytes': sum(result['output_bytes'] for result in subreddits),
+            'seconds': round(time.monotonic() - started, 3),
+        },
+    }
+    summary_path = os.path.join(output_dir, SUMMARY_FILE)
+    with open(summary_path + '.tmp', 'w') as file:
+        json.dump(summary, file, indent=2)
+    os.replace(summary_path + '.tmp', summary_path)
+    return summary
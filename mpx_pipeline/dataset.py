@@ -0,0 +1,234 @@
+"""
+The condensed comments as one partitioned Parquet dataset, written by the condense step (see mpx_pipeline/condense.py)
+alongside its .csv files.
+
+The dataset is a directory of Parquet files in the compact representation of mpx_pipeline/compact.py, laid out in Hive
+partitions by subreddit, term set and month of creation:
+    condensed_comments/subreddit=lgbt/term_set=mpx/month=2022-07/part-<generation>-<run>-<task>-<chunk>.parquet
+The term sets are the condense step's outputs: 'all' for the condensed comments, 'mpx' for the monkeypox comments and
+'virus' for the virus comments, so a comment can be in more than one of them, as it is in the .csv files. The columns
+an output does not have, e.g. contains_epoxy_term for 'all', are null.
+
+Readers open the dataset lazily and only read the files of the partitions they ask for, and only the columns they ask
+for, e.g. the bodies of r/lgbt's monkeypox comments from July 2022. Combining the subreddits is therefore a matter of
+which partitions are read, and counting their rows only reads the Parquet footers.
+
+A run writes its files with a leading '.', which readers skip, and renames them once the subreddit is done. Each file
+name holds the generation and the run of the condense state (see load_state() in mpx_pipeline/condense.py) it belongs
+to, so files left by an interrupted run, or by the generation before a full rebuild, are told apart and removed.
+"""
+
+import os
+
+import pandas as pd
+
+from .compact import compact
+
+# Optional dependency: pyarrow, to write and read the Parquet files
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    ds = None
+    pq = None
+
+# Name of the dataset's directory in the condense step's output directory
+DATASET_NAME = 'condensed_comments'
+
+# Term set of each output of the condense step
+TERM_SETS = {'condensed': 'all', 'mpx': 'mpx', 'virus': 'virus'}
+
+# The columns of the files, in the compact representation. The subreddit is a partition key.
+FILE_COLUMNS = ['author', 'body', 'created_utc', 'retrieved_utc', 'permalink', 'link_id', 'parent_id',
+                'parent_is_submission', 'converted_createdutc', 'thread_title', 'contains_monkeypox_term',
+                'contains_virus_term', 'contains_epoxy_term']
+
+# The partition keys, outermost first
+PARTITION_KEYS = ['subreddit', 'term_set', 'month']
+
+
+def file_schema():
+    """
+    The pyarrow.Schema of the dataset's files.
+    """
+    if pa is None:
+        raise ImportError('the condensed dataset needs pyarrow: pip install pyarrow')
+    text = pa.dictionary(pa.int32(), pa.string())
+    types = {
+        'author': text,
+        'body': pa.string(),
+        'created_utc': pa.int64(),
+        'retrieved_utc': pa.int64(),
+        'permalink': pa.string(),
+        'link_id': pa.int64(),
+        'parent_id': pa.int64(),
+        'parent_is_submission': pa.bool_(),
+        'converted_createdutc': pa.timestamp('s', tz='UTC'),
+        'thread_title': text,
+        'contains_monkeypox_term': pa.bool_(),
+        'contains_virus_term': pa.bool_(),
+        'contains_epoxy_term': pa.bool_(),
+    }
+    return pa.schema([pa.field(column, types[column]) for column in FILE_COLUMNS])
+
+
+def partitioning():
+    """
+    The Hive partitioning of the dataset.
+    """
+    return ds.partitioning(pa.schema([pa.field(key, pa.string()) for key in PARTITION_KEYS]), flavor='hive')
+
+
+def part_name(prefix, task, chunk):
+    """
+    The name of a file as it is written, before it is published: hidden, with the run's prefix.
+    """
+    return '.%s%d-%d.parquet' % (prefix, task, chunk)
+
+
+def run_prefix(generation, run):
+    return 'part-%s-%d-' % (generation, run)
+
+
+def write_parts(root, subreddit, name, data, prefix, task, chunk):
+    """
+    Write a chunk of one of the condense step's outputs to the dataset, one hidden file per month.
+
+    Parameters
+    ----------
+    root: a string
+        The dataset's directory.
+    subreddit: a string
+        The subreddit of the chunk.
+    name: a string
+        The output, 'condensed', 'mpx' or 'virus'.
+    data: a DataFrame
+        The chunk, with the output's columns.
+    prefix: a string
+        The run's prefix, see run_prefix().
+    task, chunk: integers
+        Where the chunk comes from, to name the files.
+    """
+    if len(data) == 0:
+        return
+    data = compact(data)
+    schema = file_schema()
+    for column in FILE_COLUMNS:
+        if column not in data:
+            data[column] = None
+    created = pd.to_datetime(data['created_utc'].astype('float64'), unit='s', utc=True)
+    months = (created.dt.year * 100 + created.dt.month).astype('Int64')
+    for month, rows in data.groupby(months, sort=True):
+        directory = os.path.join(root, 'subreddit=' + subreddit, 'term_set=' + TERM_SETS[name],
+                                 'month=%04d-%02d' % divmod(int(month), 100))
+        os.makedirs(directory, exist_ok=True)
+        table = pa.Table.from_pandas(rows[FILE_COLUMNS], schema=schema, preserve_index=False)
+        pq.write_table(table, os.path.join(directory, part_name(prefix, task, chunk)), compression='zstd')
+
+
+def _subreddit_files(root, subreddit):
+    # Every file of a subreddit, published or not
+    for directory, _, names in os.walk(os.path.join(root, 'subreddit=' + subreddit)):
+        for name in names:
+            yield directory, name
+
+
+def publish(root, subreddit, prefix):
+    """
+    Make the files a run has written for a subreddit visible to readers.
+    """
+    for directory, name in list(_subreddit_files(root, subreddit)):
+        if name.startswith('.' + prefix):
+            os.replace(os.path.join(directory, name), os.path.join(directory, name[1:]))
+
+
+def discard(root, subreddit, prefix):
+    """
+    Remove the files a run has written for a subreddit but not published.
+    """
+    for directory, name in list(_subreddit_files(root, subreddit)):
+        if name.startswith('.' + prefix):
+            os.remove(os.path.join(directory, name))
+
+
+def clean(root, subreddit, generation=None, run=0):
+    """
+    Remove the files of a subreddit that do not belong to its state: the hidden files of runs that did not finish, and
+    the files of other generations or of later runs. With no generation, every file of the subreddit is removed.
+    """
+    for directory, name in list(_subreddit_files(root, subreddit)):
+        parts = name.split('-')
+        keep = (generation is not None and not name.startswith('.') and len(parts) >= 5 and parts[0] == 'part'
+                and parts[1] == generation and int(parts[2]) <= run)
+        if not keep:
+            os.remove(os.path.join(directory, name))
+    # Partitions left empty
+    for directory, _, _ in sorted(os.walk(os.path.join(root, 'subreddit=' + subreddit)), reverse=True):
+        if not os.listdir(directory):
+            os.rmdir(directory)
+
+
+def open_dataset(root):
+    """
+    Open the dataset lazily: nothing but the directory listing is read until it is scanned.
+    """
+    if ds is None:
+        raise ImportError('reading ' + root + ' needs pyarrow: pip install pyarrow')
+    return ds.dataset(root, format='parquet', schema=pa.unify_schemas([file_schema(), partitioning().schema]),
+                      partitioning=partitioning())
+
+
+def dataset_filter(term_set='all', subreddits=None, start=None, end=None):
+    """
+    The filter expression of a term set, subreddits and a created_utc range [start, end).
+    """
+    expression = ds.field('term_set') == term_set
+    if subreddits is not None:
+        expression &= ds.field('subreddit').isin(list(subreddits))
+    # The month partitions prune the files, created_utc the rows
+    if start is not None:
+        expression &= ds.field('month') >= pd.Timestamp(start, unit='s').strftime('%Y-%m')
+        expression &= ds.field('created_utc') >= start
+    if end is not None:
+        expression &= ds.field('month') <= pd.Timestamp(end, unit='s').strftime('%Y-%m')
+        expression &= ds.field('created_utc') < end
+    return expression
+
+
+def read_dataset(root, term_set='all', subreddits=None, columns=None, start=None, end=None):
+    """
+    Read comments from the dataset.
+
+    Parameters
+    ----------
+    root: a string
+        The dataset's directory.
+    term_set: a string
+        'all', 'mpx' or 'virus'.
+    subreddits: a list
+        The subreddits to read. Defaults to all of them.
+    columns: a list
+        The columns to read, e.g. ['body']. Defaults to all of them, with the partition keys.
+    start, end: integers
+        Only the comments created in [start, end), in epoch seconds.
+
+    Returns
+    -------
+    A DataFrame of the compact representation (see mpx_pipeline/compact.py).
+    """
+    table = open_dataset(root).to_table(columns=columns, filter=dataset_filter(term_set, subreddits, start, end))
+    return table.to_pandas()
+
+
+def count_rows(root, term_set='all', subreddits=None):
+    """
+    The number of comments of a term set in each subreddit, from the files' footers.
+    """
+    dataset = open_dataset(root)
+    counts = {}
+    for fragment in dataset.get_fragments(filter=dataset_filter(term_set, subreddits)):
+        subreddit = ds.get_partition_keys(fragment.partition_expression)['subreddit']
+        counts[subreddit] = counts.get(subreddit, 0) + fragment.metadata.num_rows
+    return counts
@@ -0,0 +1,196 @@
+"""
+Manifests of the datasets written by the pipeline, and a stats command that reads them.
+
+A manifest is a small JSON file next to a dataset, e.g. lgbt_subreddit_comments_all.parquet.manifest.json, written
+when the dataset is. It holds the number of rows, the first and last created_utc, the size of the dataset in bytes and
+a hash of its schema, so that questions like "how many comments does r/lgbt have" are answered without loading it.
+
+When a dataset has no manifest, or has been rewritten since its manifest was, the same numbers are read from the
+Parquet footer (row counts and column statistics) or the Feather file's record batches instead, which also takes
+milliseconds.
+
+To print the stats of every dataset in the current directory:
+    python -m mpx_pipeline.manifest *_subreddit_comments_all.parquet
+"""
+
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import os
+
+# Optional dependency: pyarrow, to read the metadata of datasets without a manifest
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pc = None
+    pq = None
+
+# Column whose range is recorded
+TIME_COLUMN = 'created_utc'
+
+
+def manifest_path(path):
+    """
+    The manifest of a dataset, e.g. comments.parquet.manifest.json.
+    """
+    return path + '.manifest.json'
+
+
+def schema_hash(schema):
+    """
+    A short hash of an Arrow schema's column names and types, to tell whether two datasets have the same columns.
+    """
+    columns = [[field.name, str(field.type)] for field in schema]
+    return hashlib.sha256(json.dumps(columns).encode('utf-8')).hexdigest()[:16]
+
+
+class TimeRange:
+    """
+    Keeps the smallest and largest created_utc of the tables passed to update().
+    """
+
+    def __init__(self):
+        self.min = None
+        self.max = None
+
+    def update(self, table):
+        if TIME_COLUMN not in table.column_names or table.num_rows == 0:
+            return
+        result = pc.min_max(table.column(TIME_COLUMN))
+        low, high = result['min'].as_py(), result['max'].as_py()
+        if low is not None and (self.min is None or low < self.min):
+            self.min = low
+        if high is not None and (self.max is None or high > self.max):
+            self.max = high
+
+
+def write_manifest(path, format, rows, schema, created_utc_min=None, created_utc_max=None, **extra):
+    """
+    Write the manifest of a dataset that has just been written.
+
+    Parameters
+    ----------
+    path: a string
+        The dataset.
+    format: a string
+        'parquet' or 'feather'.
+    rows: an integer
+        Number of rows in the dataset.
+    schema: a pyarrow.Schema
+        Schema of the dataset.
+    created_utc_min, created_utc_max: integers
+        Range of the dataset's created_utc column, None if it has none.
+    extra:
+        Anything else to record, e.g. the number of quarantined rows.
+    """
+    manifest = {
+        'path': os.path.basename(path),
+        'format': format,
+        'rows': rows,
+        'created_utc_min': created_utc_min,
+        'created_utc_max': created_utc_max,
+        'bytes': os.path.getsize(path),
+        'schema_hash': schema_hash(schema),
+        'columns': schema.names,
+        'written_at': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }
+    manifest.update(extra)
+    temp_path = manifest_path(path) + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temp_path, manifest_path(path))
+    return manifest
+
+
+def read_manifest(path):
+    """
+    Return the manifest of a dataset, or None if it has none or the dataset has changed size since it was written.
+    """
+    try:
+        with open(manifest_path(path)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('bytes') != os.path.getsize(path):
+        return None
+    return manifest
+
+
+def _parquet_stats(path):
+    file = pq.ParquetFile(path)
+    metadata = file.metadata
+    low = high = None
+    if TIME_COLUMN in file.schema_arrow.names:
+        column = file.schema_arrow.get_field_index(TIME_COLUMN)
+        for i in range(metadata.num_row_groups):
+            statistics = metadata.row_group(i).column(column).statistics
+            if statistics is None or not statistics.has_min_max:
+                # Without statistics the range is unknown rather than wrong
+                low = high = None
+                break
+            low = statistics.min if low is None else min(low, statistics.min)
+            high = statistics.max if high is None else max(high, statistics.max)
+    return {'rows': metadata.num_rows, 'created_utc_min': low, 'created_utc_max': high,
+            'schema_hash': schema_hash(file.schema_arrow)}
+
+
+def _feather_stats(path):
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        time_range = TimeRange()
+        rows = 0
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            rows += batch.num_rows
+            time_range.update(pa.Table.from_batches([batch]))
+        return {'rows': rows, 'created_utc_min': time_range.min, 'created_utc_max': time_range.max,
+                'schema_hash': schema_hash(reader.schema)}
+
+
+def dataset_stats(path):
+    """
+    Return the rows, created_utc range, bytes and schema hash of a dataset, from its manifest if it is up to date,
+    otherwise from the file's metadata.
+    """
+    manifest = read_manifest(path)
+    if manifest is not None:
+        return dict(manifest, source='manifest')
+    if pa is None:
+        raise ImportError('reading the metadata of ' + path + ' needs pyarrow: pip install pyarrow')
+    stats = _feather_stats(path) if path.endswith('.feather') else _parquet_stats(path)
+    stats.update({'path': os.path.basename(path), 'bytes': os.path.getsize(path), 'source': 'metadata'})
+    return stats
+
+
+def format_time(epoch_time):
+    if epoch_time is None:
+        return '-'
+    return datetime.datetime.fromtimestamp(epoch_time, datetime.timezone.utc).strftime('%Y-%m-%d %H:%M')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the row counts and time ranges of datasets.')
+    parser.add_argument('paths', nargs='*', default=None,
+                        help='Parquet or Feather datasets (default: every one in the current directory)')
+    parser.add_argument('--json', action='store_true', help='print the stats as JSON')
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob('*.parquet') + glob.glob('*.feather'))
+    stats = [dataset_stats(path) for path in paths]
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print('%-48s %10s %17s %17s %10s %16s %9s' % ('dataset', 'rows', 'first', 'last', 'MB', 'schema',
+                                                     'source'))
+        for entry in stats:
+            print('%-48s %10d %17s %17s %10.1f %16s %9s' % (entry['path'], entry['rows'],
+                                                           format_time(entry['created_utc_min']),
+                                                           format_time(entry['created_utc_max']),
+                                                           entry['bytes'] / 1e6, entry['schema_hash'],
+                                                           entry['source']))
+        print('%-48s %10d' % ('total', sum(entry['rows'] for entry in stats)))
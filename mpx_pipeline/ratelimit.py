@@ -0,0 +1,364 @@
+"""
+Rate limiting and retries for the Pushshift scraper.
+
+All the scraper's worker threads share one RateLimiter per host. It combines:
+- a token bucket that paces requests to the allowed rate, lowering the rate when the server answers 429 and raising it
+  back towards the allowed rate as requests succeed (additive increase, multiplicative decrease)
+- exponential backoff with full jitter for 429s, 5xx responses and connection errors, honouring Retry-After
+- a circuit breaker that pauses every worker after repeated failures instead of letting each of them hammer a server
+  that is down
+- per-endpoint metrics (requests/s, retries, failures, latency percentiles) for tuning the above
+"""
+
+import math
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+# HTTP status codes that are worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504, 520, 521, 522, 524}
+
+
+class RetryError(Exception):
+    """
+    Raised when a request still fails after every retry.
+    """
+
+    def __init__(self, endpoint, attempts, reason):
+        super().__init__('%s failed after %d attempts: %s' % (endpoint, attempts, reason))
+        self.endpoint = endpoint
+        self.attempts = attempts
+        self.reason = reason
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket. Tokens are added at `rate` per second up to `capacity`; each request takes one token.
+
+    Parameters
+    ----------
+    rate: a float
+        Tokens added per second, i.e., the sustained request rate.
+    capacity: a float
+        Largest burst of requests allowed. Defaults to one second of tokens.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Block until a token is available, then take it.
+        """
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate):
+        """
+        Change the refill rate, keeping the tokens already earned at the old rate.
+        """
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+
+
+class CircuitBreaker:
+    """
+    A thread-safe circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and no request is let through for `reset_timeout`
+    seconds. The circuit then half-opens: one trial request is let through while the others keep waiting. If the trial
+    succeeds the circuit closes again, otherwise it re-opens.
+
+    Parameters
+    ----------
+    failure_threshold: an integer
+        Number of failures in a row that opens the circuit.
+    reset_timeout: a float
+        Seconds the circuit stays open before a trial request is let through.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        """
+        Return 0 if a request may be sent now, otherwise the number of seconds to wait before asking again.
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    return remaining
+                self.state = self.HALF_OPEN
+            # Half-open: let exactly one trial request through
+            if self.trial_running:
+                return min(1.0, self.reset_timeout)
+            self.trial_running = True
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def release_trial(self):
+        """
+        End a half-open trial request without a verdict, e.g., when it was throttled, so that the next request becomes
+        the trial. The state of the circuit is left as it is.
+        """
+        with self.lock:
+            self.trial_running = False
+
+
+class EndpointMetrics:
+    """
+    Counters and latencies for one endpoint. Latencies are kept for the most recent `window` requests only, so memory
+    stays bounded on long scrapes.
+    """
+
+    def __init__(self, window=10000):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.successes = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled = 0
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, latency, status):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            if status == 200:
+                self.successes += 1
+            elif status == 429:
+                self.throttled += 1
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    def summary(self):
+        """
+        Return the metrics as a dictionary: request counts, requests per second, and p50/p90/p99 latency in seconds.
+        """
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            latencies = sorted(self.latencies)
+            summary = {
+                'requests': self.requests,
+                'successes': self.successes,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'failures': self.failures,
+                'requests_per_second': self.requests / elapsed if elapsed > 0 else 0.0,
+            }
+        for name, q in (('p50', 0.50), ('p90', 0.90), ('p99', 0.99)):
+            summary['latency_' + name] = percentile(latencies, q)
+        return summary
+
+
+def percentile(sorted_values, q):
+    """
+    Return the q-th quantile (0 <= q <= 1) of an already sorted list with the nearest-rank method, or None if the list
+    is empty.
+    """
+    if not sorted_values:
+        return None
+    rank = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header, given either in seconds or as an HTTP date. Returns the number of seconds to wait, or
+    None if the header is missing or cannot be parsed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class RateLimiter:
+    """
+    Paces, retries and measures the requests sent to one host. One instance is shared by every worker thread.
+
+    Parameters
+    ----------
+    rate: a float
+        Allowed number of requests per second. The limiter never goes above this rate.
+    min_rate: a float
+        Lowest rate the limiter slows down to when the server keeps answering 429.
+    increase: a float
+        Requests per second added back to the rate after each successful request.
+    max_retries: an integer
+        Number of retries before a request is given up with a RetryError.
+    base_delay: a float
+        Backoff, in seconds, before the first retry. It doubles with every retry.
+    max_delay: a float
+        Longest backoff, in seconds, between two retries.
+    failure_threshold: an integer
+        Number of failed requests in a row that opens the circuit breaker.
+    reset_timeout: a float
+        Seconds the circuit breaker stays open.
+    """
+
+    def __init__(self, rate=2.0, min_rate=0.1, increase=0.05, max_retries=8, base_delay=1.0, max_delay=120.0,
+                 failure_threshold=5, reset_timeout=60.0):
+        self.max_rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.increase = increase
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def endpoint_metrics(self, endpoint):
+        with self.lock:
+            if endpoint not in self.metrics:
+                self.metrics[endpoint] = EndpointMetrics()
+            return self.metrics[endpoint]
+
+    def summary(self):
+        """
+        Return the metrics of every endpoint, keyed by endpoint, along with the current request rate.
+        """
+        with self.lock:
+            endpoints = list(self.metrics.items())
+        summary = {endpoint: metrics.summary() for endpoint, metrics in endpoints}
+        summary['rate'] = self.bucket.rate
+        return summary
+
+    def backoff(self, attempt):
+        """
+        Exponential backoff with full jitter: a random delay between 0 and base_delay * 2^attempt, capped at
+        max_delay.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _slow_down(self):
+        with self.lock:
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+
+    def _speed_up(self):
+        with self.lock:
+            if self.bucket.rate < self.max_rate:
+                self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.increase))
+
+    def request(self, endpoint, send):
+        """
+        Send a request through the limiter, retrying until it succeeds.
+
+        Parameters
+        ----------
+        endpoint: a string
+            Name the metrics are recorded under, e.g., the URL path.
+        send: a function
+            Called with no arguments to send the request. It returns a response with `status_code` and `headers`
+            attributes (e.g., a requests.Response) or raises an OSError (which includes requests' exceptions).
+
+        Returns
+        -------
+        The first response with status code 200. Other 4xx responses are returned as they are, since retrying them
+        would not help.
+        """
+        metrics = self.endpoint_metrics(endpoint)
+        reason = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                metrics.record_retry()
+
+            # Wait while the circuit is open, then for a token
+            wait = self.breaker.wait_time()
+            while wait > 0:
+                time.sleep(wait)
+                wait = self.breaker.wait_time()
+            self.bucket.acquire()
+
+            started = time.monotonic()
+            try:
+                response = send()
+            except OSError as error:
+                metrics.record(time.monotonic() - started, None)
+                self.breaker.record_failure()
+                reason = repr(error)
+                time.sleep(self.backoff(attempt))
+                continue
+            metrics.record(time.monotonic() - started, response.status_code)
+
+            if response.status_code not in RETRY_STATUS_CODES:
+                self.breaker.record_success()
+                if response.status_code == 200:
+                    self._speed_up()
+                return response
+
+            # Throttled or server error: back off, for as long as the server asks if it says so
+            reason = 'HTTP %d' % response.status_code
+            if response.status_code == 429:
+                # The server is up, so a throttled trial request neither closes nor re-opens the circuit
+                self._slow_down()
+                self.breaker.release_trial()
+            else:
+                self.breaker.record_failure()
+            delay = parse_retry_after(response.headers.get('Retry-After'))
+            if delay is None:
+                delay = self.backoff(attempt)
+            time.sleep(min(delay, self.max_delay))
+
+        metrics.record_failure()
+        raise RetryError(endpoint, self.max_retries + 1, reason)
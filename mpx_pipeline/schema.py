@@ -0,0 +1,157 @@
+"""
+The declared types of the columns the pipeline keeps, and their vectorized coercion.
+
+Each schema lists the fields of one type of Pushshift object with their type: 'string', 'category' (a string column
+stored as a dictionary of its distinct values, e.g. subreddit), 'int64' (e.g. epoch seconds) or 'float64'. Fields
+marked as required must be present in every row.
+
+coerce() applies a schema to a chunk of objects a whole column at a time. Values that cannot be coerced to their
+field's type, e.g. 'TRUE' for created_utc or a number for body, are not silently turned into missing values: the rows
+holding them are set apart, with the reason, so that they can be written to a quarantine file and looked at.
+"""
+
+import collections
+
+import pandas as pd
+
+# Optional dependency: pyarrow, for the Arrow schema of the Parquet and Feather files
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+Field = collections.namedtuple('Field', ['name', 'type', 'required'])
+
+# The fields of the comments the pipeline keeps (see FIELD_PROFILES in 01_scrape_subreddit_comments.py)
+COMMENT_SCHEMA = [
+    Field('id', 'string', True),
+    Field('author', 'string', False),
+    Field('body', 'string', False),
+    Field('subreddit', 'category', True),
+    Field('created_utc', 'int64', True),
+    Field('retrieved_utc', 'int64', False),
+    Field('permalink', 'string', False),
+    Field('link_id', 'string', False),
+    Field('parent_id', 'string', False),
+    Field('score', 'int64', False),
+]
+
+# The fields of the submissions the pipeline keeps, for their thread titles
+SUBMISSION_SCHEMA = [
+    Field('id', 'string', True),
+    Field('title', 'string', False),
+    Field('author', 'string', False),
+    Field('subreddit', 'category', True),
+    Field('created_utc', 'int64', True),
+    Field('retrieved_utc', 'int64', False),
+    Field('permalink', 'string', False),
+    Field('num_comments', 'int64', False),
+]
+
+SCHEMAS = {'comment': COMMENT_SCHEMA, 'submission': SUBMISSION_SCHEMA}
+
+
+def arrow_schema(schema):
+    """
+    Return the pyarrow.Schema of a declared schema.
+    """
+    if pa is None:
+        raise ImportError('the Arrow schema needs pyarrow: pip install pyarrow')
+    types = {
+        'string': pa.string(),
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+    }
+    return pa.schema([pa.field(field.name, types[field.type], nullable=not field.required) for field in schema])
+
+
+def _is_instance_mask(values, kinds):
+    # Per value type check, only needed for columns of mixed types
+    return values.map(lambda value: isinstance(value, kinds))
+
+
+def coerce_column(values, type):
+    """
+    Coerce a column to a declared type.
+
+    Parameters
+    ----------
+    values: a pandas Series
+        The column, as built from the raw objects.
+    type: a string
+        'string', 'category', 'int64' or 'float64'.
+
+    Returns
+    -------
+    The coerced column, and a boolean Series that is True where a value is present but could not be coerced.
+    """
+    present = values.notna()
+    inferred = pd.api.types.infer_dtype(values, skipna=True)
+
+    if type in ('string', 'category'):
+        if inferred in ('string', 'empty'):
+            bad = pd.Series(False, index=values.index)
+        else:
+            bad = present & ~_is_instance_mask(values, str)
+        column = values.astype(object).where(present & ~bad, None)
+        return (column.astype('category') if type == 'category' else column), bad
+
+    if type in ('int64', 'float64'):
+        # A bool is a number to pandas, but in a numeric column it means the columns have shifted
+        if inferred in ('integer', 'floating', 'mixed-integer-float', 'empty'):
+            not_numbers = pd.Series(False, index=values.index)
+        else:
+            not_numbers = present & (_is_instance_mask(values, (bool, dict, list)) | (inferred == 'boolean'))
+        numbers = pd.to_numeric(values.where(~not_numbers), errors='coerce')
+        bad = present & (not_numbers | numbers.isna())
+        if type == 'int64':
+            bad |= present & numbers.notna() & (numbers % 1 != 0)
+            return numbers.where(~bad).astype('Int64'), bad
+        return numbers.where(~bad).astype('float64'), bad
+
+    raise ValueError('unknown field type: ' + str(type))
+
+
+def coerce(objects, schema):
+    """
+    Apply a declared schema to a chunk of objects.
+
+    Parameters
+    ----------
+    objects: a list
+        Dictionaries, e.g. a chunk of the scraper's output.
+    schema: a list
+        Fields, e.g. COMMENT_SCHEMA.
+
+    Returns
+    -------
+    A DataFrame with one column per field, of its declared type, holding the rows that match the schema, and a list
+    of the rows that do not, each a dictionary with the original 'object' and the 'errors' found in it (field name ->
+    offending value, or 'missing' for a required field that is absent).
+    """
+    raw = pd.DataFrame.from_records(objects) if objects else pd.DataFrame()
+    index = pd.RangeIndex(len(objects))
+    columns = {}
+    bad_masks = {}
+    for field in schema:
+        values = raw[field.name] if field.name in raw else pd.Series(None, index=index, dtype=object)
+        column, bad = coerce_column(values, field.type)
+        if field.required:
+            bad = bad | values.isna()
+        columns[field.name] = column
+        bad_masks[field.name] = bad
+
+    data = pd.DataFrame(columns, index=index)
+    any_bad = pd.DataFrame(bad_masks, index=index).any(axis=1)
+
+    quarantined = []
+    for i in any_bad[any_bad].index:
+        obj = objects[i]
+        errors = {}
+        for field in schema:
+            if bad_masks[field.name][i]:
+                errors[field.name] = obj[field.name] if obj.get(field.name) is not None else 'missing'
+        quarantined.append({'object': obj, 'errors': errors})
+
+    return data[~any_bad].reset_index(drop=True), quarantined
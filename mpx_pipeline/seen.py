@@ -0,0 +1,157 @@
+"""
+A persistent index of the Reddit ids already written, so that overlapping runs and re-scrapes never write the same
+object twice.
+
+Ids are decoded from base 36 to integers and kept as the primary key of an SQLite table, i.e., in an on-disk B-tree.
+Lookups take a handful of page reads whatever the number of ids, and memory use is bounded by SQLite's page cache, not
+by the size of the index.
+
+New ids are committed in batches, in step with the scraper's checkpoints. Each id remembers the batch it was added in,
+so an interrupted run can roll the index back to the batch of its last checkpoint, along with the output.
+"""
+
+import sqlite3
+
+
+def decode_id(reddit_id):
+    """
+    Decode a base-36 Reddit id (with or without a 't1_'-style prefix) into an integer.
+    """
+    if reddit_id[2:3] == '_':
+        reddit_id = reddit_id[3:]
+    return int(reddit_id, 36)
+
+
+def encode_id(number):
+    """
+    Encode an integer as a base-36 Reddit id, without prefix. The inverse of decode_id().
+    """
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    text = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        text = digits[remainder] + text
+        if number == 0:
+            return text
+
+
+class SeenIndex:
+    """
+    A persistent set of integer ids.
+
+    Parameters
+    ----------
+    path: a string
+        SQLite file holding the index. Created if it does not exist.
+    cache_mb: an integer
+        Largest amount of memory SQLite's page cache may use, in megabytes.
+    """
+
+    def __init__(self, path, cache_mb=64):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # A commit must be on disk before the scraper's checkpoint that refers to it
+        self.connection.execute('PRAGMA synchronous=FULL')
+        self.connection.execute('PRAGMA cache_size=%d' % (-cache_mb * 1024))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS seen (id INTEGER PRIMARY KEY, batch INTEGER NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self.connection.commit()
+
+        # Ids added from now on belong to the batch after the last committed one
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'batch'").fetchone()
+        self.batch = (row[0] if row else 0) + 1
+
+    def __contains__(self, id):
+        return self.connection.execute('SELECT 1 FROM seen WHERE id = ?', (id,)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+
+    def add(self, id):
+        """
+        Add an id. Returns True if it is new, False if it was already in the index.
+        """
+        cursor = self.connection.execute('INSERT OR IGNORE INTO seen (id, batch) VALUES (?, ?)', (id, self.batch))
+        return cursor.rowcount == 1
+
+    def add_many(self, ids):
+        """
+        Add many ids at once, e.g., to build the index from objects scraped before it existed, and commit them.
+        """
+        self.connection.executemany('INSERT OR IGNORE INTO seen (id, batch) VALUES (?, ?)',
+                                    ((id, self.batch) for id in ids))
+        return self.commit()
+
+    def commit(self):
+        """
+        Make every id added since the last commit durable, as one batch. Returns the number of that batch.
+        """
+        batch = self.batch
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('batch', ?)", (batch,))
+        self.connection.commit()
+        self.batch += 1
+        return batch
+
+    def rollback_to(self, batch):
+        """
+        Remove every id added after the given batch, committed or not.
+        """
+        self.connection.rollback()
+        self.connection.execute('DELETE FROM seen WHERE batch > ?', (batch,))
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('batch', ?)", (batch,))
+        self.connection.commit()
+        self.batch = batch + 1
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+
+class DedupWriter:
+    """
+    Wraps a writer (see mpx_pipeline.sinks) so that objects whose id is already in a SeenIndex are dropped, and the
+    ids of the objects written are added to it.
+
+    Its checkpoint holds the wrapped writer's checkpoint and the index batch committed with it; restoring it rolls
+    both back together.
+
+    Parameters
+    ----------
+    writer: a writer
+        Receives the objects that have not been seen before.
+    index: a SeenIndex
+        The ids seen so far.
+    """
+
+    def __init__(self, writer, index):
+        self.writer = writer
+        self.index = index
+        self.encoder = writer.encoder
+        self.skipped = 0
+
+    def write(self, obj):
+        if self.index.add(decode_id(obj['id'])):
+            self.writer.write(obj)
+        else:
+            self.skipped += 1
+
+    def flush(self, sync=False):
+        self.writer.flush(sync)
+
+    def checkpoint(self):
+        # The objects go to disk first, then the ids that refer to them
+        state = self.writer.checkpoint()
+        return {'writer': state, 'batch': self.index.commit()}
+
+    def restore(self, state):
+        # A checkpoint taken without the index only holds the writer's state
+        if 'batch' not in state:
+            self.writer.restore(state)
+            return
+        self.writer.restore(state['writer'])
+        self.index.rollback_to(state['batch'])
+
+    def close(self):
+        self.writer.close()
+        self.index.close()
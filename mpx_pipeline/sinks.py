@@ -0,0 +1,398 @@
+"""
+Writers and readers for newline-delimited JSON (NDJSON) files of scraped Reddit objects.
+
+PartitionedSink writes objects into a Hive-style directory layout, one directory per subreddit and month of creation:
+
+    <root>/subreddit=lgbt/month=2022-05/part-00000.ndjson.zst
+
+Objects are encoded with a fast JSON encoder (orjson when it is installed), buffered in memory, and written a buffer at
+a time as one independent zstd frame or gzip member. Concatenated frames/members are still a valid compressed file, so
+a part can be appended to and truncated back to any frame boundary, which is what makes the sink resumable. A part is
+closed and the next one started once it reaches a size limit or an age limit.
+
+NDJSONFile is the plain, single-file counterpart, used for temporary files.
+
+RoutingWriter sends each object to one or more named writers (e.g., the monkeypox and virus streams) chosen by a
+routing function, optionally along with a writer that receives every object.
+
+iter_ndjson reads any of these back, plain or compressed, file or directory.
+"""
+
+import glob
+import gzip
+import io
+import json
+import os
+import re
+import time
+
+# Optional dependencies: orjson for fast encoding and decoding, zstandard for zstd compression
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File extension for each compression
+EXTENSIONS = {None: '.ndjson', 'gzip': '.ndjson.gz', 'zstd': '.ndjson.zst'}
+
+PART_PATTERN = re.compile(r'^part-(\d+)\.ndjson(\.gz|\.zst)?$')
+
+
+# Decoder used by iter_ndjson
+loads = orjson.loads if orjson is not None else json.loads
+
+
+def get_encoder(name=None):
+    """
+    Return a function that encodes an object as one line of JSON, in bytes, without the newline.
+
+    Parameters
+    ----------
+    name: a string
+        'orjson' or 'json'. Defaults to orjson when it is installed, otherwise the standard library's json.
+    """
+    if name is None:
+        name = 'orjson' if orjson is not None else 'json'
+    if name == 'orjson':
+        if orjson is None:
+            raise ImportError('the orjson encoder needs orjson: pip install orjson')
+        return orjson.dumps
+    if name == 'json':
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        return lambda obj: encoder.encode(obj).encode('utf-8')
+    raise ValueError('unknown JSON encoder: ' + str(name))
+
+
+def default_compression():
+    """
+    Return 'zstd' when zstandard is installed, otherwise 'gzip'.
+    """
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def compress(data, compression, level=None):
+    """
+    Compress a buffer into one self-contained zstd frame or gzip member (or return it as is if compression is None).
+    """
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=level if level is not None else 6)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstd compression needs zstandard: pip install zstandard')
+        return zstandard.ZstdCompressor(level=level if level is not None else 3).compress(data)
+    raise ValueError('unknown compression: ' + str(compression))
+
+
+def month_partition(obj):
+    """
+    The default partitioning: subreddit=<subreddit>/month=<YYYY-MM>, by the object's created_utc (UTC).
+    """
+    created_utc = obj.get('created_utc')
+    month = time.strftime('%Y-%m', time.gmtime(int(created_utc))) if created_utc is not None else 'unknown'
+    return 'subreddit=' + str(obj.get('subreddit')) + os.sep + 'month=' + month
+
+
+def _append(path, data, sync):
+    with open(path, 'ab') as file:
+        file.write(data)
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+        return file.tell()
+
+
+def _truncate(path, size):
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        os.truncate(path, size)
+
+
+class NDJSONFile:
+    """
+    A buffered, appending NDJSON writer for one uncompressed file.
+
+    Parameters
+    ----------
+    path: a string
+        File to append to.
+    encoder: a function
+        Object to JSON bytes encoder, see get_encoder().
+    buffer_bytes: an integer
+        Number of bytes buffered in memory before they are written.
+    """
+
+    def __init__(self, path, encoder=None, buffer_bytes=1 << 20):
+        self.path = path
+        self.encoder = encoder or get_encoder()
+        self.buffer_bytes = buffer_bytes
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, obj):
+        line = self.encoder(obj) + b'\n'
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if self.buffered >= self.buffer_bytes:
+            self.flush()
+
+    def flush(self, sync=False):
+        if self.buffer:
+            _append(self.path, b''.join(self.buffer), sync)
+            self.buffer = []
+            self.buffered = 0
+
+    def checkpoint(self):
+        """
+        Flush everything to disk and return the state to restore() to if the writer is interrupted.
+        """
+        self.flush(sync=True)
+        return {'offset': os.path.getsize(self.path) if os.path.exists(self.path) else 0}
+
+    def restore(self, state):
+        """
+        Undo everything written after the checkpoint that returned `state`.
+        """
+        self.buffer = []
+        self.buffered = 0
+        _truncate(self.path, state['offset'])
+
+    def close(self):
+        self.flush()
+
+
+class PartitionedSink:
+    """
+    A buffered NDJSON writer that partitions objects into directories, compresses them, and rotates part files.
+
+    Parameters
+    ----------
+    root: a string
+        Directory the partitions are written under.
+    compression: a string
+        'zstd', 'gzip' or None. Defaults to default_compression().
+    encoder: a function
+        Object to JSON bytes encoder, see get_encoder().
+    partition: a function
+        Returns the relative directory of an object. Defaults to month_partition().
+    buffer_bytes: an integer
+        Uncompressed bytes buffered per partition before they are compressed and written.
+    max_bytes: an integer
+        Compressed size after which a part is closed and the next one started.
+    max_seconds: a float
+        Age after which a part is closed and the next one started. None means parts never rotate by age.
+    level: an integer
+        Compression level. Defaults to 3 for zstd and 6 for gzip.
+    """
+
+    def __init__(self, root, compression='default', encoder=None, partition=month_partition, buffer_bytes=4 << 20,
+                 max_bytes=256 << 20, max_seconds=None, level=None):
+        self.root = root
+        self.compression = default_compression() if compression == 'default' else compression
+        self.extension = EXTENSIONS[self.compression]
+        self.encoder = encoder or get_encoder()
+        self.partition = partition
+        self.buffer_bytes = buffer_bytes
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.level = level
+
+        # Partition -> current part number and size, and when the part was started
+        self.parts = {}
+        self.started = {}
+        # Partition -> buffered lines and their size
+        self.buffers = {}
+        self.buffered = {}
+        # After a restore(), partitions that were not in the checkpoint only hold data written after it
+        self.restored = False
+
+    def _part_path(self, key, part):
+        return os.path.join(self.root, key, 'part-%05d%s' % (part, self.extension))
+
+    def _existing_parts(self, key):
+        parts = []
+        for path in glob.glob(os.path.join(glob.escape(os.path.join(self.root, key)), 'part-*')):
+            match = PART_PATTERN.match(os.path.basename(path))
+            if match:
+                parts.append((int(match.group(1)), path))
+        return sorted(parts)
+
+    def _open_partition(self, key):
+        # Carry on with the last part already on disk, or start the first one
+        os.makedirs(os.path.join(self.root, key), exist_ok=True)
+        existing = self._existing_parts(key)
+        if self.restored:
+            # Left over from after the checkpoint: it is about to be written again
+            for _, path in existing:
+                os.remove(path)
+            existing = []
+        if existing:
+            part, path = existing[-1]
+            self.parts[key] = {'part': part, 'size': os.path.getsize(path)}
+        else:
+            self.parts[key] = {'part': 0, 'size': 0}
+        self.started[key] = time.monotonic()
+
+    def write(self, obj):
+        key = self.partition(obj)
+        line = self.encoder(obj) + b'\n'
+        if key not in self.buffers:
+            self.buffers[key] = []
+            self.buffered[key] = 0
+        self.buffers[key].append(line)
+        self.buffered[key] += len(line)
+        if self.buffered[key] >= self.buffer_bytes:
+            self._flush_partition(key)
+
+    def _flush_partition(self, key, sync=False):
+        if not self.buffers.get(key):
+            return
+        if key not in self.parts:
+            self._open_partition(key)
+        current = self.parts[key]
+
+        # Rotate to a new part once the current one is too big or too old
+        too_big = current['size'] >= self.max_bytes
+        too_old = self.max_seconds is not None and time.monotonic() - self.started[key] >= self.max_seconds
+        if current['size'] > 0 and (too_big or too_old):
+            current['part'] += 1
+            current['size'] = 0
+            self.started[key] = time.monotonic()
+
+        data = compress(b''.join(self.buffers[key]), self.compression, self.level)
+        current['size'] = _append(self._part_path(key, current['part']), data, sync)
+        self.buffers[key] = []
+        self.buffered[key] = 0
+
+    def flush(self, sync=False):
+        for key in list(self.buffers):
+            self._flush_partition(key, sync)
+
+    def checkpoint(self):
+        """
+        Flush everything to disk and return the state to restore() to if the sink is interrupted: the current part and
+        its size in every partition.
+        """
+        self.flush(sync=True)
+        return {'parts': {key: dict(current) for key, current in self.parts.items()}}
+
+    def restore(self, state):
+        """
+        Undo everything written after the checkpoint that returned `state`: truncate each partition's current part to
+        its checkpointed size and delete the parts started after it.
+        """
+        self.buffers = {}
+        self.buffered = {}
+        self.parts = {}
+        for key, current in state['parts'].items():
+            for part, path in self._existing_parts(key):
+                if part > current['part']:
+                    os.remove(path)
+            _truncate(self._part_path(key, current['part']), current['size'])
+            self.parts[key] = dict(current)
+            self.started[key] = time.monotonic()
+        self.restored = True
+
+    def close(self):
+        self.flush()
+
+
+class RoutingWriter:
+    """
+    Writes each object to the writers its route names, and to every writer in `everything` (if any).
+
+    It has the same write/checkpoint/restore/close interface as the other writers, so it can stand in for one. Its
+    checkpoint holds the checkpoint of each writer.
+
+    Parameters
+    ----------
+    route: a function
+        Returns the names of the writers an object goes to (possibly none).
+    writers: a dictionary
+        Writer name -> writer.
+    everything: a writer
+        Receives every object whatever its route. None to keep only the routed objects.
+    """
+
+    def __init__(self, route, writers, everything=None):
+        self.route = route
+        self.writers = dict(writers)
+        self.everything = everything
+        self.encoder = (everything or next(iter(self.writers.values()))).encoder
+        self.counts = {name: 0 for name in self.writers}
+
+    def _all_writers(self):
+        writers = dict(self.writers)
+        if self.everything is not None:
+            writers['everything'] = self.everything
+        return writers
+
+    def write(self, obj):
+        if self.everything is not None:
+            self.everything.write(obj)
+        for name in self.route(obj):
+            self.writers[name].write(obj)
+            self.counts[name] += 1
+
+    def flush(self, sync=False):
+        for writer in self._all_writers().values():
+            writer.flush(sync)
+
+    def checkpoint(self):
+        return {name: writer.checkpoint() for name, writer in self._all_writers().items()}
+
+    def restore(self, state):
+        # A writer missing from the checkpoint was not in use when it was taken, so there is nothing to undo
+        for name, writer in self._all_writers().items():
+            if name in state:
+                writer.restore(state[name])
+
+    def close(self):
+        for writer in self._all_writers().values():
+            writer.close()
+
+
+def open_ndjson(path):
+    """
+    Open a plain, gzip or zstd NDJSON file for reading text lines, going by its extension.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('reading ' + path + ' needs zstandard: pip install zstandard')
+        raw = open(path, 'rb')
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def ndjson_files(path):
+    """
+    List the NDJSON files at a path: the file itself, or every .json/.ndjson file (plain or compressed) under a
+    directory, in sorted order.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    files = []
+    for directory, _, names in os.walk(path):
+        for name in names:
+            if re.search(r'\.(nd)?json(\.gz|\.zst)?$', name):
+                files.append(os.path.join(directory, name))
+    return sorted(files)
+
+
+def iter_ndjson(path):
+    """
+    Yield every object in an NDJSON file or in every NDJSON file under a directory, plain or compressed.
+    """
+    for file_path in ndjson_files(path):
+        with open_ndjson(file_path) as file:
+            for line in file:
+                if line.strip():
+                    yield loads(line)
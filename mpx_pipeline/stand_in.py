@@ -0,0 +1,362 @@
+"""
+An offline stand-in for the Pushshift API, for testing and benchmarking the scraper without hitting the live service.
+
+It serves /reddit/comment/search/ and /reddit/submission/search/ from an in-memory corpus, either synthetic or recorded
+(any NDJSON file or directory that mpx_pipeline.sinks.iter_ndjson can read), and honours the query parameters the
+scraper sends: subreddit, after, before, sort, size and fields. Latency, 429s and 5xx errors can be injected to see how
+the scraper copes with a slow or unreliable server.
+
+To serve 100,000 synthetic comments over three subreddits with 50 ms of latency and 5% of requests throttled:
+    python -m mpx_pipeline.stand_in --comments 100000 --subreddits 3 --latency-ms 50 --throttle-rate 0.05
+
+Then point the scraper at it:
+    python src/01_scrape_subreddit_comments.py --base-url http://127.0.0.1:8080/reddit
+"""
+
+import argparse
+import bisect
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .sinks import iter_ndjson
+
+# The scraper's default start time, 05/01/2022 @ 12:00am (UTC)
+DEFAULT_START = 1651363200
+
+# Words the synthetic comments are made of, including the terms the pipeline searches for
+WORDS = ['the', 'a', 'and', 'to', 'of', 'i', 'you', 'it', 'is', 'that', 'in', 'this', 'for', 'my', 'was', 'just',
+         'like', 'but', 'have', 'be', 'so', 'not', 'people', 'gay', 'trans', 'friend', 'really', 'think', 'know',
+         'love', 'feel', 'get', 'time', 'good', 'pride', 'queer', 'community', 'doctor', 'clinic', 'appointment']
+TERMS = ['monkeypox', 'mpx', 'vaccine', 'jynneos', 'virus', 'cdc', 'epoxy', 'vaxxed']
+
+PATH_PATTERN = re.compile(r'/reddit/(comment|submission)/search/?$')
+
+
+def to_base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    text = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        text = digits[remainder] + text
+        if number == 0:
+            return text
+
+
+def synthetic_corpus(comments=10000, subreddits=('lgbt', 'gaymers', 'askgaybros'), start=DEFAULT_START,
+                     span=60 * 60 * 24 * 180, term_rate=0.01, seed=0):
+    """
+    Generate a reproducible corpus of comments spread evenly over `span` seconds after `start`, in creation order.
+
+    Parameters
+    ----------
+    comments: an integer
+        Number of comments.
+    subreddits: a list
+        Subreddits the comments are spread over.
+    start: an integer
+        Epoch time of the first comment.
+    span: an integer
+        Number of seconds the comments are spread over.
+    term_rate: a float
+        Share of comments that mention one of the monkeypox/virus search terms.
+    seed: an integer
+        Seed for the random number generator.
+
+    Returns
+    -------
+    A list of comment dictionaries with the fields Pushshift returns that the pipeline uses.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(comments):
+        subreddit = subreddits[i % len(subreddits)]
+        created_utc = start + 1 + (i * span) // max(1, comments)
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 60))]
+        if rng.random() < term_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(TERMS))
+        comment_id = to_base36(10 ** 8 + i)
+        link_id = to_base36(10 ** 7 + i // 50)
+        corpus.append({
+            'id': comment_id,
+            'author': 'user_%d' % rng.randrange(max(1, comments // 20)),
+            'body': ' '.join(words),
+            'subreddit': subreddit,
+            'created_utc': created_utc,
+            'retrieved_utc': created_utc + 3600,
+            'link_id': 't3_' + link_id,
+            'parent_id': 't3_' + link_id,
+            'permalink': '/r/%s/comments/%s/thread_number_%d/%s/' % (subreddit, link_id, i // 50, comment_id),
+            'score': rng.randint(-5, 100),
+        })
+    return corpus
+
+
+def synthetic_submissions(comments, term_rate=0.05, seed=0):
+    """
+    Generate the submissions (threads) that synthetic comments belong to, one per link_id, each created just before
+    its first comment, with a title that mentions a search term now and then.
+
+    Parameters
+    ----------
+    comments: a list
+        Comments from synthetic_corpus().
+    term_rate: a float
+        Share of titles that mention one of the monkeypox/virus search terms.
+    seed: an integer
+        Seed for the random number generator.
+    """
+    rng = random.Random(seed)
+    submissions = {}
+    for comment in comments:
+        link_id = comment['link_id']
+        if link_id in submissions:
+            continue
+        words = [rng.choice(WORDS) for _ in range(rng.randint(2, 12))]
+        if rng.random() < term_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(TERMS))
+        submission_id = link_id[3:]
+        submissions[link_id] = {
+            'id': submission_id,
+            'title': ' '.join(words).capitalize(),
+            'author': comment['author'],
+            'subreddit': comment['subreddit'],
+            'created_utc': comment['created_utc'] - 1,
+            'retrieved_utc': comment['created_utc'] + 3600,
+            'permalink': '/r/%s/comments/%s/%s/' % (comment['subreddit'], submission_id, '_'.join(words[:8])),
+            'num_comments': 0,
+        }
+    return list(submissions.values())
+
+
+class Corpus:
+    """
+    The objects served by the stand-in, indexed by subreddit and creation time.
+
+    Parameters
+    ----------
+    comments: an iterable
+        Comment dictionaries, each with at least id, subreddit and created_utc.
+    submissions: an iterable
+        Submission dictionaries, each with at least id, subreddit and created_utc.
+    """
+
+    def __init__(self, comments=(), submissions=()):
+        self.indexes = {'comment': self._index(comments), 'submission': self._index(submissions)}
+
+    @staticmethod
+    def _index(objects):
+        # Subreddit (lower case, or None for all) -> (sorted created_utc values, objects in the same order)
+        groups = {None: []}
+        for obj in objects:
+            groups[None].append(obj)
+            groups.setdefault(str(obj.get('subreddit')).lower(), []).append(obj)
+        index = {}
+        for key, group in groups.items():
+            group.sort(key=lambda x: (x['created_utc'], int(x['id'], 36)))
+            index[key] = ([x['created_utc'] for x in group], group)
+        return index
+
+    def search(self, type, params):
+        """
+        Answer a search with Pushshift's semantics: objects created strictly after `after` and strictly before
+        `before`, sorted by created_utc in `sort` order, at most `size` of them, restricted to `fields`.
+        """
+        index = self.indexes[type]
+        size = min(1000, int(params.get('size', 25)))
+        after = int(params['after']) if 'after' in params else None
+        before = int(params['before']) if 'before' in params else None
+        descending = params.get('sort', 'desc') == 'desc'
+        fields = params['fields'].split(',') if params.get('fields') else None
+
+        if params.get('subreddit'):
+            keys = [subreddit.lower() for subreddit in params['subreddit'].split(',')]
+        else:
+            keys = [None]
+
+        results = []
+        for key in keys:
+            if key not in index:
+                continue
+            times, objects = index[key]
+            lo = bisect.bisect_right(times, after) if after is not None else 0
+            hi = bisect.bisect_left(times, before) if before is not None else len(times)
+            if descending:
+                results.extend(objects[max(lo, hi - size):hi][::-1])
+            else:
+                results.extend(objects[lo:min(hi, lo + size)])
+
+        # Several subreddits: merge, then cut to size again
+        if len(keys) > 1:
+            results.sort(key=lambda x: x['created_utc'], reverse=descending)
+            results = results[:size]
+
+        if fields is not None:
+            results = [{field: x[field] for field in fields if field in x} for x in results]
+        return results
+
+
+class Faults:
+    """
+    Faults injected into the stand-in's responses.
+
+    Parameters
+    ----------
+    latency_ms: a float
+        Mean delay added to every response, in milliseconds.
+    jitter_ms: a float
+        Each delay is drawn uniformly from latency_ms +/- jitter_ms.
+    throttle_rate: a float
+        Share of requests answered with 429 Too Many Requests.
+    error_rate: a float
+        Share of requests answered with a 500, 502 or 503.
+    retry_after: a float
+        Retry-After header sent with 429s, in seconds. None sends no header.
+    seed: an integer
+        Seed for the random number generator.
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, throttle_rate=0.0, error_rate=0.0, retry_after=None, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        """
+        Return the delay in seconds and the status code (200 unless a fault is injected) for the next request.
+        """
+        with self.lock:
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            roll = self.rng.random()
+            if roll < self.throttle_rate:
+                status = 429
+            elif roll < self.throttle_rate + self.error_rate:
+                status = self.rng.choice([500, 502, 503])
+            else:
+                status = 200
+        return delay, status
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Set on the subclass that make_server() creates
+    corpus = None
+    faults = None
+
+    # Keep connections alive like the real service, so the scraper's pooled session is exercised
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        match = PATH_PATTERN.match(url.path)
+        if not match:
+            self._send(404, {'error': 'not found'})
+            return
+
+        delay, status = self.faults.draw()
+        if delay:
+            time.sleep(delay)
+        if status == 429:
+            headers = {}
+            if self.faults.retry_after is not None:
+                headers['Retry-After'] = str(self.faults.retry_after)
+            self._send(429, {'error': 'Too Many Requests'}, headers)
+            return
+        if status != 200:
+            self._send(status, {'error': 'injected server error'})
+            return
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            data = self.corpus.search(match.group(1), params)
+        except (KeyError, ValueError) as error:
+            self._send(400, {'error': repr(error)})
+            return
+        self._send(200, {'data': data})
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Stay quiet: the scraper sends thousands of requests
+        pass
+
+
+def make_server(corpus, faults=None, host='127.0.0.1', port=0):
+    """
+    Create (but do not start) a stand-in server. Port 0 picks a free port; the chosen one is server.server_address[1].
+    """
+    handler = type('Handler', (StandInHandler,), {'corpus': corpus, 'faults': faults or Faults()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(corpus, faults=None, host='127.0.0.1', port=0):
+    """
+    Start a stand-in server in a background thread. Returns the server and its base URL, to pass to the scraper as
+    --base-url. Stop it with server.shutdown().
+    """
+    server = make_server(corpus, faults, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://%s:%d/reddit' % (host, server.server_address[1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve an offline stand-in for the Pushshift search API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--corpus', default=None,
+                        help='NDJSON file or directory of recorded comments (default: synthetic comments)')
+    parser.add_argument('--submissions', default=None,
+                        help='NDJSON file or directory of recorded submissions (default: synthetic submissions for '
+                             'synthetic comments)')
+    parser.add_argument('--comments', type=int, default=100000, help='number of synthetic comments')
+    parser.add_argument('--subreddits', type=int, default=3, help='number of synthetic subreddits')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.corpus is not None:
+        comments = list(iter_ndjson(args.corpus))
+    else:
+        names = ['lgbt', 'gaymers', 'ainbow', 'askgaybros', 'asktransgender', 'MtF', 'NonBinary', 'ftm',
+                 'BisexualTeens'][:args.subreddits]
+        comments = synthetic_corpus(args.comments, names, seed=args.seed)
+    if args.submissions is not None:
+        submissions = list(iter_ndjson(args.submissions))
+    elif args.corpus is None:
+        submissions = synthetic_submissions(comments, seed=args.seed)
+    else:
+        submissions = []
+
+    faults = Faults(args.latency_ms, args.jitter_ms, args.throttle_rate, args.error_rate, args.retry_after,
+                    args.seed)
+    server = make_server(Corpus(comments, submissions), faults, args.host, args.port)
+    print('Serving %d comments and %d submissions on http://%s:%d/reddit'
+          % (len(comments), len(submissions), args.host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
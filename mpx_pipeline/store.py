@@ -0,0 +1,291 @@
+"""
+An embedded, indexed store of the condensed comments, so that the later stages query it instead of each parsing the
+same .csv files again.
+
+The store is an SQLite file with one table of comments, each labelled with its term set: 'all', 'mpx' and 'virus' for
+the condense step's outputs (see mpx_pipeline/condense.py), or any other name for a file loaded with load_csv(), e.g.
+'mpx_filtered' for the monkeypox comments left after 05.2_filter_data.R. The ids are decoded to integers, as in the
+compact representation (see mpx_pipeline/compact.py). Indexes on created_utc, subreddit, author and link_id, each led
+by the term set, answer time windows, subreddit slices, an author's comments and a thread's comments by reading only
+the rows asked for.
+
+Each file is loaded once: the store remembers the size and modification time of the files it was loaded from, and
+loading a file again only reloads it if it has changed.
+
+To load the outputs of 04.1_condense_data.py in the current directory, and the filtered monkeypox comments:
+    python -m mpx_pipeline.store comments.sqlite --condensed-dir . \\
+        --csv mpx_filtered=data/combined_subreddits/all_subreddits_mpx_data.csv
+"""
+
+import argparse
+import os
+import sqlite3
+
+import pandas as pd
+
+from .compact import CATEGORY_COLUMNS, ID_COLUMNS, STRING_COLUMNS, compact
+from .condense import OUTPUT_NAMES, SUBREDDITS
+from .dataset import TERM_SETS
+
+# The columns of the comments table and their SQLite types
+COLUMNS = [
+    ('term_set', 'TEXT NOT NULL'),
+    ('subreddit', 'TEXT'),
+    ('author', 'TEXT'),
+    ('body', 'TEXT'),
+    ('created_utc', 'INTEGER'),
+    ('retrieved_utc', 'INTEGER'),
+    ('permalink', 'TEXT'),
+    ('link_id', 'INTEGER'),
+    ('parent_id', 'INTEGER'),
+    ('parent_is_submission', 'INTEGER'),
+    ('thread_title', 'TEXT'),
+    ('contains_monkeypox_term', 'INTEGER'),
+    ('contains_virus_term', 'INTEGER'),
+    ('contains_epoxy_term', 'INTEGER'),
+]
+
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+
+# Every query filters on the term set, so it leads each index
+INDEXES = {
+    'comments_created_utc': ['term_set', 'created_utc'],
+    'comments_subreddit': ['term_set', 'subreddit', 'created_utc'],
+    'comments_author': ['term_set', 'author'],
+    'comments_link_id': ['term_set', 'link_id'],
+}
+
+# Length of each time bucket of time_series(), in seconds
+FREQUENCIES = {'hour': 3600, 'day': 86400, 'week': 7 * 86400}
+
+# Where the buckets start, in seconds after the epoch: weeks start on Monday 1970-01-05, since the epoch is a Thursday
+BUCKET_ORIGINS = {'hour': 0, 'day': 0, 'week': 4 * 86400}
+
+
+class CommentStore:
+    """
+    The comment store.
+
+    Parameters
+    ----------
+    path: a string
+        SQLite file holding the store. Created if it does not exist.
+    cache_mb: an integer
+        Largest amount of memory SQLite's page cache may use, in megabytes.
+    """
+
+    def __init__(self, path, cache_mb=256):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA cache_size=%d' % (-cache_mb * 1024))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS comments (%s)'
+                                % ', '.join(name + ' ' + type for name, type in COLUMNS))
+        for index, columns in INDEXES.items():
+            self.connection.execute('CREATE INDEX IF NOT EXISTS %s ON comments (%s)' % (index, ', '.join(columns)))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, term_set TEXT NOT NULL, '
+                                'subreddit TEXT, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, '
+                                'rows INTEGER NOT NULL)')
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM comments').fetchone()[0]
+
+    def term_sets(self):
+        """
+        The term sets in the store, with their number of comments.
+        """
+        return dict(self.connection.execute('SELECT term_set, COUNT(*) FROM comments GROUP BY term_set'))
+
+    def _loaded(self, path):
+        # Whether the file is in the store as it is on disk now
+        row = self.connection.execute('SELECT size, mtime_ns FROM sources WHERE path = ?',
+                                      (os.path.abspath(path),)).fetchone()
+        status = os.stat(path)
+        return row is not None and tuple(row) == (status.st_size, status.st_mtime_ns)
+
+    def load_csv(self, path, term_set, subreddit=None, chunk_rows=100000, force=False):
+        """
+        Load a .csv file of condensed comments into the store, replacing the comments of the term set (or only those
+        of one subreddit), unless it is already loaded and has not changed since.
+
+        Parameters
+        ----------
+        path: a string
+            The file, e.g. all_subreddits_mpx_data.csv. Columns the store does not keep are ignored.
+        term_set: a string
+            The term set to label the comments with.
+        subreddit: a string
+            The subreddit of every comment of the file, if it is one subreddit's file. Its comments are then the
+            only ones replaced.
+        chunk_rows: an integer
+            Number of rows parsed and inserted at a time.
+        force: a boolean
+            Load the file even if it has not changed.
+
+        Returns
+        -------
+        The number of comments loaded, 0 if the file was already loaded.
+        """
+        if not force and self._loaded(path):
+            return 0
+        status = os.stat(path)
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = [column for column in COLUMN_NAMES if column in header]
+        rows = 0
+        with self.connection:
+            if subreddit is None:
+                self.connection.execute('DELETE FROM comments WHERE term_set = ?', (term_set,))
+                self.connection.execute('DELETE FROM sources WHERE term_set = ?', (term_set,))
+            else:
+                self.connection.execute('DELETE FROM comments WHERE term_set = ? AND subreddit = ?',
+                                        (term_set, subreddit))
+                self.connection.execute('DELETE FROM sources WHERE term_set = ? AND (subreddit = ? OR subreddit IS '
+                                        'NULL)', (term_set, subreddit))
+            chunks = pd.read_csv(path, usecols=usecols, chunksize=chunk_rows,
+                                 dtype={column: str for column in CATEGORY_COLUMNS + ID_COLUMNS + STRING_COLUMNS})
+            for chunk in chunks:
+                data = compact(chunk)
+                data['term_set'] = term_set
+                data = data.reindex(columns=COLUMN_NAMES)
+                # Plain Python values, None for the missing ones
+                records = data.astype(object).where(data.notna(), None)
+                self.connection.executemany('INSERT INTO comments (%s) VALUES (%s)'
+                                            % (', '.join(COLUMN_NAMES), ', '.join('?' * len(COLUMN_NAMES))),
+                                            records.itertuples(index=False, name=None))
+                rows += len(data)
+            self.connection.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)',
+                                    (os.path.abspath(path), term_set, subreddit, status.st_size,
+                                     status.st_mtime_ns, rows))
+        return rows
+
+    def load_condensed(self, input_dir='.', subreddits=SUBREDDITS, chunk_rows=100000):
+        """
+        Load the condensed, mpx and virus .csv files of the condense step into the 'all', 'mpx' and 'virus' term sets,
+        skipping the files that have not changed since they were loaded.
+
+        Returns
+        -------
+        A dictionary from term set to the number of comments loaded.
+        """
+        loaded = dict.fromkeys(TERM_SETS.values(), 0)
+        for subreddit in subreddits:
+            for name, pattern in OUTPUT_NAMES.items():
+                path = os.path.join(input_dir, pattern.format(subreddit=subreddit))
+                if os.path.exists(path):
+                    loaded[TERM_SETS[name]] += self.load_csv(path, TERM_SETS[name], subreddit, chunk_rows)
+        return loaded
+
+    def _where(self, term_set, subreddits=None, start=None, end=None, authors=None, link_ids=None):
+        conditions = ['term_set = ?']
+        parameters = [term_set]
+        for column, values in [('subreddit', subreddits), ('author', authors), ('link_id', link_ids)]:
+            if values is not None:
+                values = list(values)
+                conditions.append('%s IN (%s)' % (column, ', '.join('?' * len(values))))
+                parameters.extend(values)
+        if start is not None:
+            conditions.append('created_utc >= ?')
+            parameters.append(int(start))
+        if end is not None:
+            conditions.append('created_utc < ?')
+            parameters.append(int(end))
+        return ' AND '.join(conditions), parameters
+
+    def query(self, term_set='all', subreddits=None, start=None, end=None, authors=None, link_ids=None,
+              columns=None):
+        """
+        Return comments of a term set, in the order they were loaded.
+
+        Parameters
+        ----------
+        term_set: a string
+            e.g. 'all', 'mpx', 'virus' or the term set of a file loaded with load_csv().
+        subreddits: a list
+            Only the comments of these subreddits. Defaults to all of them.
+        start, end: integers
+            Only the comments created in [start, end), in epoch seconds.
+        authors: a list
+            Only the comments of these authors.
+        link_ids: a list
+            Only the comments of these threads, as integers (see mpx_pipeline.seen.decode_id).
+        columns: a list
+            The columns to return, e.g. ['body']. Defaults to all of them but the term set. 'converted_createdutc'
+            is computed from created_utc.
+
+        Returns
+        -------
+        A DataFrame with subreddit, author and thread_title as categoricals and the flags as booleans.
+        """
+        columns = list(columns) if columns is not None else COLUMN_NAMES[1:] + ['converted_createdutc']
+        selected = [column for column in columns if column != 'converted_createdutc']
+        if 'converted_createdutc' in columns and 'created_utc' not in selected:
+            selected.append('created_utc')
+        where, parameters = self._where(term_set, subreddits, start, end, authors, link_ids)
+        data = pd.read_sql_query('SELECT %s FROM comments WHERE %s ORDER BY rowid' % (', '.join(selected), where),
+                                 self.connection, params=parameters)
+        for column in ['subreddit', 'author', 'thread_title']:
+            if column in data:
+                data[column] = data[column].astype('category')
+        for column in ['parent_is_submission', 'contains_monkeypox_term', 'contains_virus_term',
+                       'contains_epoxy_term']:
+            if column in data and data[column].notna().all():
+                data[column] = data[column].astype(bool)
+        if 'converted_createdutc' in columns:
+            data['converted_createdutc'] = pd.to_datetime(data['created_utc'], unit='s', utc=True)
+        return data[columns]
+
+    def count(self, term_set='all', by='subreddit', subreddits=None, start=None, end=None):
+        """
+        Count the comments of a term set by subreddit or by author. Returns a Series, largest count first.
+        """
+        if by not in ('subreddit', 'author'):
+            raise ValueError('can only count by subreddit or author, not ' + str(by))
+        where, parameters = self._where(term_set, subreddits, start, end)
+        rows = self.connection.execute('SELECT %s, COUNT(*) FROM comments WHERE %s GROUP BY %s ORDER BY 2 DESC'
+                                       % (by, where, by), parameters).fetchall()
+        return pd.Series(dict(rows), name='comments', dtype='int64').rename_axis(by)
+
+    def time_series(self, term_set='all', frequency='day', subreddits=None, start=None, end=None):
+        """
+        Count the comments of a term set in each hour, day or week (UTC), per subreddit. Weeks start on Monday at
+        00:00 UTC.
+
+        Returns
+        -------
+        A DataFrame with the start of each period as index, one column per subreddit, and 0 where there were none.
+        """
+        seconds = FREQUENCIES[frequency]
+        origin = BUCKET_ORIGINS[frequency]
+        where, parameters = self._where(term_set, subreddits, start, end)
+        data = pd.read_sql_query('SELECT (created_utc - %d) / %d * %d + %d AS period, subreddit, COUNT(*) AS comments '
+                                 'FROM comments WHERE %s AND created_utc IS NOT NULL GROUP BY 1, 2'
+                                 % (origin, seconds, seconds, origin, where), self.connection, params=parameters)
+        data['period'] = pd.to_datetime(data['period'], unit='s', utc=True)
+        return data.pivot(index='period', columns='subreddit', values='comments').fillna(0).astype('int64')
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load condensed comments into the comment store.')
+    parser.add_argument('path', help='SQLite file of the store, e.g. comments.sqlite')
+    parser.add_argument('--condensed-dir', default=None,
+                        help="directory of 04.1_condense_data.py's .csv files, to load as 'all', 'mpx' and 'virus'")
+    parser.add_argument('--subreddits', nargs='*', default=SUBREDDITS)
+    parser.add_argument('--csv', nargs='*', default=[], metavar='TERM_SET=PATH',
+                        help='other condensed .csv files to load, each as a term set')
+    parser.add_argument('--force', action='store_true', help='reload the files even if they have not changed')
+    args = parser.parse_args()
+
+    store = CommentStore(args.path)
+    if args.condensed_dir is not None:
+        for term_set, rows in store.load_condensed(args.condensed_dir, args.subreddits).items():
+            print('Loaded', rows, 'comments into', term_set)
+    for argument in args.csv:
+        term_set, path = argument.split('=', 1)
+        print('Loaded', store.load_csv(path, term_set, force=args.force), 'comments into', term_set)
+    for term_set, rows in sorted(store.term_sets().items()):
+        print('%-20s %10d' % (term_set, rows))
+    store.close()
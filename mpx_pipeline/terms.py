@@ -0,0 +1,168 @@
+"""
+The monkeypox and virus search terms, and the rules 04.1_condense_data.py uses to decide whether a comment is about
+monkeypox or a virus, so that the scraper can route comments as they arrive with the same rules.
+
+A comment mentions a term when its body or its thread title contains the term, ignoring case. A comment with no body
+mentions nothing. Monkeypox comments that mention 'epoxy' are dropped, since those are usually about crafts.
+
+TermClassifier does the matching: every term of every category is compiled into one regular expression, and the
+lower-cased body and title of a comment are scanned once for all of them, instead of once per term and category.
+Terms can be limited to whole words, and a category can be ruled out by the match of another one.
+"""
+
+import re
+
+from .titles import permalink_title
+
+# Search terms related to monkeypox
+MONKEYPOX_TERMS = ['monkey pox', 'monkeypox', 'pox', 'orthopox', 'mpx', 'gaypox', 'mpox', 'jynneos', 'acam2000']
+
+# Search terms related to virus
+VIRUS_TERMS = ['virus', 'cdc', 'vaccine', 'vax', 'vaccinated']
+
+# Terms that rule a monkeypox match out
+EXCLUSION_TERMS = ['epoxy']
+
+
+class TermClassifier:
+    """
+    Flags which categories of search terms a text mentions, in a single scan of the text.
+
+    The terms are compiled into one alternation inside a lookahead, so that overlapping terms are all found: 'epoxy'
+    mentions both 'epoxy' and 'pox', exactly as checking each term on its own would find.
+
+    Parameters
+    ----------
+    categories: a dictionary
+        Category name -> its terms, in lower case. Each category gets a contains_<name>_term flag.
+    whole_words: a list
+        Terms that only match as whole words, e.g. 'cdc' but not 'abcdc'. The others match anywhere in a word.
+    exclusions: a dictionary
+        Category name -> the categories whose match rules it out, see keep().
+    """
+
+    def __init__(self, categories, whole_words=(), exclusions=None):
+        self.categories = list(categories)
+        self.exclusions = dict(exclusions or {})
+        self.columns = ['contains_%s_term' % name for name in self.categories]
+
+        # Term -> bit mask of the categories it belongs to
+        self.term_bits = {}
+        for bit, name in enumerate(self.categories):
+            for term in categories[name]:
+                self.term_bits[term.lower()] = self.term_bits.get(term.lower(), 0) | (1 << bit)
+
+        # Longest terms first, so that at any position the longest term is the one reported. A term inside a longer
+        # one is then only reported at that position as the longer term, so the longer term carries its categories
+        whole_words = {term.lower() for term in whole_words}
+        for term in self.term_bits:
+            for other in self.term_bits:
+                if other != term and other not in whole_words and other in term:
+                    self.term_bits[term] |= self.term_bits[other]
+        alternatives = []
+        for term in sorted(self.term_bits, key=len, reverse=True):
+            if term in whole_words:
+                alternatives.append(r'\b%s\b' % re.escape(term))
+            else:
+                alternatives.append(re.escape(term))
+        self.pattern = re.compile('(?=(%s))' % '|'.join(alternatives))
+
+    def bits(self, text):
+        """
+        Return the bit mask of the categories an already lower-cased text mentions.
+        """
+        bits = 0
+        for term in self.pattern.findall(text):
+            bits |= self.term_bits[term]
+        return bits
+
+    def classify(self, body, title):
+        """
+        Flag the categories a comment's body or title mentions.
+
+        Returns
+        -------
+        A dictionary with one contains_<category>_term flag per category, each 0 or 1, all 0 if the body is missing.
+        """
+        if not isinstance(body, str):
+            return {column: 0 for column in self.columns}
+        text = body.lower() + '\n' + (title.lower() if isinstance(title, str) else '')
+        bits = self.bits(text)
+        return {column: (bits >> bit) & 1 for bit, column in enumerate(self.columns)}
+
+    def classify_column(self, bodies, titles):
+        """
+        Flag the categories of whole pandas Series of bodies and titles, one scan per row.
+
+        Returns
+        -------
+        A DataFrame with the same index and one int8 contains_<category>_term column per category, all 0 in the rows
+        with no body.
+        """
+        # Only needed for whole columns, so that the scraper does not have to import them
+        import numpy as np
+        import pandas as pd
+
+        has_body = bodies.notna()
+        # The newline keeps a term from matching across the end of the body and the start of the title
+        texts = bodies.fillna('').str.lower() + '\n' + titles.fillna('').astype(str).str.lower()
+        bits = np.fromiter((self.bits(text) for text in texts), dtype=np.int64, count=len(texts))
+        bits[~has_body.to_numpy()] = 0
+        return pd.DataFrame({column: ((bits >> bit) & 1).astype(np.int8) for bit, column in enumerate(self.columns)},
+                            index=bodies.index)
+
+    def keep(self, flags, category):
+        """
+        Return whether flags from classify() (or a row of classify_column()) keep a category: it is mentioned, and
+        none of the categories that rule it out are.
+        """
+        if not flags['contains_%s_term' % category]:
+            return False
+        return not any(flags['contains_%s_term' % other] for other in self.exclusions.get(category, ()))
+
+
+# The classifier 04.1_condense_data.py and the scraper use
+CLASSIFIER = TermClassifier({'monkeypox': MONKEYPOX_TERMS, 'virus': VIRUS_TERMS, 'epoxy': EXCLUSION_TERMS},
+                            exclusions={'monkeypox': ['epoxy']})
+
+
+def comment_title(comment, titles=None):
+    """
+    Return the thread title of a Pushshift comment: the real title from `titles` (a TitleIndex, see
+    mpx_pipeline.titles) or the comment's own 'title' if there is one, otherwise the title extracted from its
+    permalink (see mpx_pipeline.titles.permalink_title, the same as 04.1_condense_data.py), or '' if none of these is
+    available.
+    """
+    if titles is not None and comment.get('link_id') in titles:
+        return titles.get(comment['link_id'])
+    if comment.get('title'):
+        return comment['title']
+    if comment.get('permalink'):
+        return permalink_title(comment['permalink'])
+    return ''
+
+
+def classify(body, title):
+    """
+    Flag whether a comment mentions a monkeypox term, a virus term, or an exclusion term in its body or title.
+
+    Returns
+    -------
+    A dictionary with contains_monkeypox_term, contains_virus_term and contains_epoxy_term, each 0 or 1.
+    """
+    return CLASSIFIER.classify(body, title)
+
+
+def route_comment(comment, titles=None):
+    """
+    Return the term sets a Pushshift comment belongs to: 'mpx' for monkeypox comments that do not mention an
+    exclusion term, and 'virus' for virus comments. Used with mpx_pipeline.sinks.RoutingWriter. The thread title is
+    looked up in `titles` (a TitleIndex) when given, see comment_title().
+    """
+    flags = classify(comment.get('body'), comment_title(comment, titles))
+    routes = []
+    if CLASSIFIER.keep(flags, 'monkeypox'):
+        routes.append('mpx')
+    if CLASSIFIER.keep(flags, 'virus'):
+        routes.append('virus')
+    return routes
@@ -0,0 +1,165 @@
+"""
+Cleaning of the comments and tweets before topic modeling (see 07.1_topic_modeling_reddit.py and
+07.2_topic_modeling_twitter.py): emails, markdown links and URLs are removed, single quotes are dropped and runs of
+whitespace become one space.
+
+These used to be six re.sub() passes over the corpus. Two of their patterns could take time quadratic or worse in the
+length of a comment: '\\[[\\S\\s]+\\]\\(https:\\/\\/[\\D]+\\)' tries every '[' against every later '](https://', and
+'\\S*@\\S*\\s?' retries the whole word from every one of its letters. Their greedy matches could also delete the text
+between two markdown links, or everything up to the last ')' of the comment.
+
+clean_text() does all the rewrites in one pass of one compiled pattern, whose parts each look at a character at most
+a bounded number of times, so cleaning takes time linear in the length of the text:
+    - an email is a word (a run of non-whitespace) holding an '@', and goes with the whitespace after it
+    - a markdown link is '[', text without brackets, '](https://', then the URL (one level of parentheses allowed)
+      and ')'
+    - a URL is 'https://' followed by letters, digits, '_', '.', '/', '-' and '='
+
+lemmatize() lemmatizes the cleaned, tokenized texts by streaming them through spaCy's nlp.pipe() in batches, over
+several processes if asked, instead of calling the pipeline once per text. Only the components the lemmas and their
+parts of speech need (tok2vec, tagger, attribute_ruler, lemmatizer) should be loaded, see LEMMA_EXCLUDE.
+
+To compare the old passes and clean_text() on adversarial comments:
+    python -m mpx_pipeline.text --benchmark
+"""
+
+import argparse
+import re
+import time
+
+# One alternative per rewrite, tried in this order at each position
+CLEANING_PATTERN = re.compile(
+    r"(?P<email>(?<!\S)[^\s@]*@\S*\s*)"
+    r"|(?P<link>\[[^\[\]]*\]\(https://(?:[^\s()]|\([^\s()]*\))*\))"
+    r"|(?P<url>https://[\w.\/\-=]+)"
+    r"|(?P<quote>')"
+    r"|(?P<space>\s+)"
+)
+
+# What each alternative is replaced with
+REPLACEMENTS = {'email': '', 'link': '', 'url': '', 'quote': '', 'space': ' '}
+
+
+def _replace(match):
+    return REPLACEMENTS[match.lastgroup]
+
+
+def clean_text(text):
+    """
+    Remove the emails, markdown links, URLs and single quotes of a text, and turn runs of whitespace into one space.
+    """
+    return CLEANING_PATTERN.sub(_replace, text)
+
+
+def clean_texts(texts):
+    """
+    Clean a list of texts, see clean_text(). Returns a list in the same order.
+    """
+    return [CLEANING_PATTERN.sub(_replace, text) for text in texts]
+
+
+# Components of spaCy's English pipelines that the lemmas do not need, to leave out when loading them
+LEMMA_EXCLUDE = ['parser', 'ner', 'senter']
+
+
+def lemmatize(documents, nlp, allowed_postags=('NOUN', 'ADJ', 'VERB', 'ADV', 'PROPN'), batch_size=1000,
+              n_process=1):
+    """
+    Lemmatize tokenized documents with spaCy, keeping the lemmas of some parts of speech.
+
+    Parameters
+    ----------
+    documents: a list
+        Lists of words, e.g. the output of gensim's simple_preprocess().
+    nlp: a spaCy Language
+        The pipeline, e.g. spacy.load('en_core_web_sm', exclude=LEMMA_EXCLUDE).
+    allowed_postags: a list
+        The parts of speech to keep.
+    batch_size: an integer
+        Number of documents sent through the pipeline at a time.
+    n_process: an integer
+        Number of processes. More than 1 needs processes started by fork (Linux), or the calling script to be guarded
+        by `if __name__ == "__main__":`.
+
+    Returns
+    -------
+    A list with the lemmas of each document, in the order of the documents.
+    """
+    allowed_postags = set(allowed_postags)
+    texts = (' '.join(words) for words in documents)
+    return [[token.lemma_ for token in doc if token.pos_ in allowed_postags]
+            for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+
+
+# The six passes clean_text() replaces, kept for the benchmark
+LEGACY_PATTERNS = [
+    ('\\S*@\\S*\\s?', ''),
+    ('\\s+', ' '),
+    ("\'", ''),
+    ('\\[[\\S\\s]+\\]\\(https:\\/\\/[\\D]+\\)', ''),
+    ('\\[\\w+\\]\\(https:\\/\\/[\\D\\d]+\\)', ''),
+    ('https:\\/\\/[\\w\\d\\.\\/\\-\\=]+', ''),
+]
+
+
+def legacy_clean_text(text):
+    for pattern, replacement in LEGACY_PATTERNS:
+        text = re.sub(pattern, replacement, text)
+    return text
+
+
+def adversarial_texts(length):
+    """
+    Texts of about `length` characters on which the legacy passes backtrack: many brackets and link openings that are
+    never closed, a long word without '@', and a long word with an '@' at its end.
+    """
+    return {
+        'unclosed links': '[a](https://b ' * (length // 14),
+        'brackets': '[x] ' * (length // 4) + '](https://',
+        'long word': 'a' * length,
+        'long word with @': 'a' * length + '@',
+        'links': 'see [this page](https://example.com/page) and ' * (length // 48),
+    }
+
+
+def benchmark(lengths=(250, 1000, 4000, 8000), budget=10.0):
+    """
+    Time the legacy passes and clean_text() on adversarial_texts() of growing lengths. The legacy passes are no longer
+    timed on a kind of text once one of them has taken more than `budget` seconds.
+
+    Returns
+    -------
+    A list of dictionaries with the kind of text, its length, and the seconds each took (None if skipped).
+    """
+    results = []
+    slow = set()
+    for length in lengths:
+        for kind, text in adversarial_texts(length).items():
+            start = time.perf_counter()
+            clean_text(text)
+            fused = time.perf_counter() - start
+            legacy = None
+            if kind not in slow:
+                start = time.perf_counter()
+                legacy_clean_text(text)
+                legacy = time.perf_counter() - start
+                if legacy > budget:
+                    slow.add(kind)
+            results.append({'kind': kind, 'length': len(text), 'legacy': legacy, 'fused': fused})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the text cleaning on adversarial inputs.')
+    parser.add_argument('--benchmark', action='store_true', help='run the benchmark')
+    parser.add_argument('--lengths', type=int, nargs='*', default=[250, 1000, 4000, 8000],
+                        help='lengths of the adversarial texts, in characters')
+    parser.add_argument('--budget', type=float, default=10.0,
+                        help='seconds after which the legacy passes are no longer timed on a kind of text')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print('%-20s %10s %12s %12s' % ('text', 'length', 'legacy (s)', 'fused (s)'))
+        for result in benchmark(args.lengths, args.budget):
+            legacy = '%12.4f' % result['legacy'] if result['legacy'] is not None else '%12s' % 'skipped'
+            print('%-20s %10d %s %12.6f' % (result['kind'], result['length'], legacy, result['fused']))
@@ -0,0 +1,83 @@
+"""
+Real thread titles for comments, from the scraped submissions.
+
+A comment's link_id is the id of its thread, e.g. 't3_abc123' for the submission with id 'abc123'. TitleIndex is a hash
+index from link_id to the submission's title, built once from the scraper's submissions output and then used to attach
+titles to comments, one at a time in the scraper or a whole column at a time in pandas.
+
+For comments whose thread was not scraped, the title can still be taken from the permalink, which holds the slug of
+the title, e.g. 'thread_number_1' in '/r/lgbt/comments/abc123/thread_number_1/def456/'.
+"""
+
+import re
+
+from .sinks import iter_ndjson
+
+# Prefix of a submission's id in a comment's link_id
+SUBMISSION_PREFIX = 't3_'
+
+# The title slug of a permalink: the path segment after /comments/<thread id>/
+PERMALINK_TITLE = re.compile(r'/comments/[^/]+/([^/]*)')
+
+
+def permalink_title(permalink):
+    """
+    Extract the title slug from a permalink, or '' if it has none.
+    """
+    match = PERMALINK_TITLE.search(permalink)
+    return match.group(1) if match else ''
+
+
+def permalink_titles(permalinks):
+    """
+    Extract the title slugs from a whole pandas Series of permalinks at once, with one compiled regex. NaN where the
+    permalink is NaN, '' where it has no title.
+    """
+    titles = permalinks.str.extract(PERMALINK_TITLE, expand=False)
+    # A permalink without a title gives '', like permalink_title()
+    return titles.mask(titles.isna() & permalinks.notna(), '')
+
+
+class TitleIndex:
+    """
+    A hash index from link_id ('t3_<submission id>') to thread title.
+
+    Parameters
+    ----------
+    titles: a dictionary
+        link_id -> title to start from.
+    """
+
+    def __init__(self, titles=None):
+        self.titles = dict(titles or {})
+
+    @classmethod
+    def from_ndjson(cls, path):
+        """
+        Build the index from an NDJSON file or directory of submissions (anything iter_ndjson reads), e.g. the
+        scraper's "submissions" directory.
+        """
+        index = cls()
+        for submission in iter_ndjson(path):
+            index.add(submission['id'], submission.get('title'))
+        return index
+
+    def add(self, submission_id, title):
+        if isinstance(title, str):
+            self.titles[SUBMISSION_PREFIX + submission_id] = title
+
+    def get(self, link_id, default=None):
+        return self.titles.get(link_id, default)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __contains__(self, link_id):
+        return link_id in self.titles
+
+    def join(self, link_ids):
+        """
+        Look up a whole pandas Series of link_ids at once. Returns a Series of titles, NaN where the thread is unknown.
+        """
+        # object dtype even when no thread is known, so that titles can be filled in afterwards
+        return link_ids.map(self.titles).astype(object)
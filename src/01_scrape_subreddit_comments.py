@@ -16,24 +16,169 @@ r/MtF
 r/NonBinary
 Note: These subreddits are the nine most popular subreddits among LGBTQ+ people.
 
-The only change that was made to this script to extract comments from those
-specified subreddits was changing the argument of the last line to the 
-according to the specific subreddit.
+Originally, the only change that was made to this script to extract comments
+from those specified subreddits was changing the argument of the last line to
+the according to the specific subreddit.
 Example: For r/gaymers, the line was changed to
     extract_reddit_data(subreddit="gaymers",type="comment")
+
+The script now takes a list of subreddits and scrapes them at the same time,
+one worker thread per subreddit, over a single pooled keep-alive HTTP session.
+The number of simultaneous connections to the Pushshift host is capped so the
+workers share the connection pool instead of opening a socket per request.
+Example: To scrape all nine subreddits
+    python 01_scrape_subreddit_comments.py
+Example: To scrape only r/gaymers and r/ainbow
+    python 01_scrape_subreddit_comments.py gaymers ainbow
+
+A single large subreddit can also be split into time shards. The window from
+--start to --end is cut into --shards equal pieces, each piece is paginated by
+its own worker, and the pieces are merged by id with duplicates removed.
+Raise --max-per-host along with --shards so the shards are not left waiting
+on the connection pool.
+Example: To scrape r/askgaybros with eight shards
+    python 01_scrape_subreddit_comments.py askgaybros --shards 8 --max-per-host 8
+
+After every page, the cursor (max_created_utc, max_id, subreddit and type) and
+the size of the output files are saved to "<subreddit>_<type>.checkpoint" in
+the output directory. If the script is stopped or crashes, running it again
+truncates anything written after the last checkpoint and carries on from the
+saved cursor, so nothing is downloaded or written twice. Running it again after it has finished only
+fetches objects created since the last run. Use --no-resume to start over.
+
+Requests are paced by a rate limiter shared by every worker (see
+mpx_pipeline/ratelimit.py) instead of a fixed sleep between pages. It keeps
+the workers together at or under --rate requests per second, slows down when
+Pushshift answers 429, retries 429s, server errors and dropped connections
+with exponential backoff (or as long as Retry-After asks), and pauses every
+worker when Pushshift keeps failing. Request metrics are printed at the end.
+
+The objects are written as compressed newline-delimited JSON, partitioned by
+subreddit and month of creation (see mpx_pipeline/sinks.py), e.g.
+    comments/subreddit=lgbt/month=2022-05/part-00000.ndjson.zst
+Part files are rotated once they reach --rotate-mb (or --rotate-hours).
+
+Only the fields given by --fields are downloaded and written. By default these
+are the columns that "04.1_condense_data.py" keeps, plus the id; use
+--fields all to keep every field Pushshift returns.
+
+With --filter, comments are also checked against the monkeypox and virus
+search terms as they arrive (see mpx_pipeline/terms.py, the same rules as
+"04.1_condense_data.py") and the matches are written to their own partitions
+in "<output dir>_mpx" and "<output dir>_virus". With --no-firehose as well,
+only the matches are kept.
+Example: For a weekly refresh of the monkeypox and virus comments only
+    python 01_scrape_subreddit_comments.py --filter --no-firehose
+
+With --with-submissions, the submissions of the same subreddits are scraped
+first, into "submissions" next to the comments. The keyword filter then
+matches the comments' real thread titles, looked up by link_id (see
+mpx_pipeline/titles.py), instead of the fragments in their permalinks, and
+"04.1_condense_data.py" attaches the same titles to the condensed data.
+Example: To scrape the comments and submissions of r/lgbt
+    python 01_scrape_subreddit_comments.py lgbt --with-submissions --filter
+
+Every id written is recorded in "<subreddit>_<type>.seen.sqlite" in the
+output directory (see mpx_pipeline/seen.py), and objects whose id is already
+there are dropped, so overlapping runs and re-scrapes never write the same
+object twice. The index is committed and rolled back together with the
+checkpoints. Use --no-dedupe to turn it off.
+Run the script from the root of the repository so mpx_pipeline can be found.
     
 This code was taken from:
 https://www.osrsbox.com/blog/2019/03/18/watercooler-scraping-an-entire-subreddit-2007scape/
 and modified accordingly for this project.
 '''
+import argparse
+import glob
+import heapq
+import os
 import requests
 import json
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+# resource is only available on Unix; it is used to report peak memory
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from mpx_pipeline import RateLimiter
+from mpx_pipeline.sinks import NDJSONFile, PartitionedSink, RoutingWriter, get_encoder
+from mpx_pipeline.seen import DedupWriter, SeenIndex
+from mpx_pipeline.terms import route_comment
+from mpx_pipeline.titles import TitleIndex
 
 PUSHSHIFT_REDDIT_URL = "http://api.pushshift.io/reddit"
 
-def fetchObjects(**kwargs):
+# Specify the start timestamp
+START_CREATED_UTC = 1651363200 # 05/01/2022 @ 12:00am (UTC)
+
+# The nine most popular subreddits among LGBTQ+ people
+SUBREDDITS = ["lgbt", "gaymers", "ainbow", "askgaybros", "asktransgender",
+              "MtF", "NonBinary", "ftm", "BisexualTeens"]
+
+# Maximum number of simultaneous connections to the Pushshift host
+MAX_CONNECTIONS_PER_HOST = 4
+
+# Allowed number of requests per second to the Pushshift host
+REQUESTS_PER_SECOND = 2.0
+
+# Fields that are always requested, since they are needed to page through the
+# results, remove duplicates and partition the output
+REQUIRED_FIELDS = ["id", "created_utc", "subreddit"]
+
+# Named field lists for --fields
+# "condense" holds the columns that 04.1_condense_data.py keeps
+# "all" keeps every field Pushshift returns
+FIELD_PROFILES = {
+    "condense": ["id", "author", "body", "subreddit", "created_utc",
+                 "retrieved_utc", "permalink", "link_id", "parent_id"],
+    "submission": ["id", "title", "author", "subreddit", "created_utc",
+                   "retrieved_utc", "permalink", "num_comments"],
+    "all": None
+    }
+
+# Field profile used for each type when --fields is not given
+DEFAULT_PROFILES = {"comment": "condense", "submission": "submission"}
+
+# One HTTP session is shared by every worker so that connections are kept
+# alive and reused between pages
+_session = None
+_session_lock = threading.Lock()
+
+def get_session(max_per_host=MAX_CONNECTIONS_PER_HOST):
+    # Create the shared session the first time it is needed
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # pool_block=True makes a worker wait for a free connection once
+            # max_per_host connections to a host are in use, which is what
+            # limits the number of concurrent requests per host
+            adapter = HTTPAdapter(pool_maxsize=max_per_host, pool_block=True)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+# One rate limiter is shared by every worker so that, together, they stay
+# under the rate the Pushshift host allows
+_rate_limiter = None
+
+def get_rate_limiter(rate=REQUESTS_PER_SECOND):
+    # Create the shared rate limiter the first time it is needed
+    global _rate_limiter
+    with _session_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(rate=rate)
+        return _rate_limiter
+
+def fetchObjects(fields=None, **kwargs):
     # Default paramaters for API query
     params = {
         "sort_type":"created_utc",
@@ -45,6 +190,11 @@ def fetchObjects(**kwargs):
     for key,value in kwargs.items():
         params[key] = value
 
+    # Ask the API for only the fields that are needed
+    if fields is not None:
+        fields = list(dict.fromkeys(REQUIRED_FIELDS + list(fields)))
+        params["fields"] = ",".join(fields)
+
     # Print API query paramaters
     print(params)
 
@@ -54,30 +204,40 @@ def fetchObjects(**kwargs):
     if 'type' in kwargs and kwargs['type'].lower() == "submission":
         type = "submission"
     
-    # Perform an API request
-    r = requests.get(PUSHSHIFT_REDDIT_URL + "/" + type + "/search/", params=params, timeout=30)
-
-    # Check the status code, if successful, process the data
-    if r.status_code == 200:
-        response = json.loads(r.text)
-        data = response['data']
-        sorted_data_by_id = sorted(data, key=lambda x: int(x['id'],36))
-        return sorted_data_by_id
-
-def extract_reddit_data(**kwargs):
-    # Speficify the start timestamp
-    max_created_utc = 1651363200 # 05/01/2022 @ 12:00am (UTC)
-    max_id = 0
+    # Perform an API request through the rate limiter, which paces it and
+    # retries it on 429s, server errors and connection errors
+    endpoint = "/" + type + "/search/"
+    r = get_rate_limiter().request(endpoint, lambda: get_session().get(
+        PUSHSHIFT_REDDIT_URL + endpoint, params=params, timeout=30))
+
+    # Any other error means the query itself is wrong, so stop here
+    r.raise_for_status()
+
+    # Process the data
+    response = json.loads(r.text)
+    data = response['data']
+
+    # Keep only the requested fields, in case the API sent back more
+    if fields is not None:
+        data = [{key: x[key] for key in fields if key in x} for x in data]
 
-    # Open a file for JSON output
-    file = open("comments.json","a")
+    sorted_data_by_id = sorted(data, key=lambda x: int(x['id'],36))
+    return sorted_data_by_id
+
+def paginate(after, before=None, max_id=0, on_page=None, **kwargs):
+    # Walk forward through every object created after the "after" timestamp
+    # (and before the "before" timestamp, if given), one page at a time
+    max_created_utc = after
 
     # While loop for recursive function
     while 1:
         nothing_processed = True
         # Call the recursive function
-        objects = fetchObjects(**kwargs,after=max_created_utc)
-        
+        if before is None:
+            objects = fetchObjects(**kwargs,after=max_created_utc)
+        else:
+            objects = fetchObjects(**kwargs,after=max_created_utc,before=before)
+
         # Loop the returned data, ordered by date
         for object in objects:
             id = int(object['id'],36)
@@ -86,17 +246,332 @@ def extract_reddit_data(**kwargs):
                 created_utc = object['created_utc']
                 max_id = id
                 if created_utc > max_created_utc: max_created_utc = created_utc
-                # Output JSON data to the opened file
-                print(json.dumps(object,sort_keys=True,ensure_ascii=True),file=file)
-        
+                yield object
+
         # Exit if nothing happened
         if nothing_processed: return
         max_created_utc -= 1
 
-        # Sleep a little before the next recursive function call
-        time.sleep(.5)
+        # Report the cursor for the next page once every object of this page
+        # has been handled by the caller
+        if on_page is not None: on_page(max_created_utc, max_id)
+
+def load_checkpoint(checkpoint_file):
+    # Return the saved cursor, or None if there is nothing to resume from
+    if not os.path.exists(checkpoint_file): return None
+    with open(checkpoint_file) as file:
+        return json.load(file)
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    # Write to a temporary file and rename it over the old checkpoint, so a
+    # crash can never leave a half-written checkpoint behind
+    tmp_file = checkpoint_file + ".tmp"
+    with open(tmp_file,"w") as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file, checkpoint_file)
+
+def check_checkpoint(checkpoint, checkpoint_file, **kwargs):
+    # Refuse to resume a cursor that belongs to a different scrape
+    subreddit = kwargs.get('subreddit')
+    type = kwargs.get('type', "comment")
+    if checkpoint['subreddit'] != subreddit or checkpoint['type'] != type:
+        raise ValueError(checkpoint_file + " is a checkpoint for r/" +
+                         str(checkpoint['subreddit']) + " " + checkpoint['type'] +
+                         "s, not r/" + str(subreddit) + " " + type + "s")
+
+def scrape_window(writer, checkpoint_file, after, before=None, resume=True, **kwargs):
+    # Scrape the window into the writer, checkpointing the cursor after every
+    # page and picking up from the last checkpoint on restart
+    max_id = 0
+
+    checkpoint = load_checkpoint(checkpoint_file) if resume else None
+    if checkpoint is not None:
+        check_checkpoint(checkpoint, checkpoint_file, **kwargs)
+        after = checkpoint['max_created_utc']
+        max_id = checkpoint['max_id']
+        # Drop anything written to the output after the checkpoint was taken
+        writer.restore(checkpoint['output'])
+        print("Resuming " + checkpoint_file + " after " + str(after))
+
+    def on_page(max_created_utc, max_id):
+        # The objects must be on disk before the cursor moves past them, so
+        # the writer's own checkpoint flushes and syncs them first
+        save_checkpoint(checkpoint_file, {
+            'subreddit': kwargs.get('subreddit'),
+            'type': kwargs.get('type', "comment"),
+            'max_created_utc': max_created_utc,
+            'max_id': max_id,
+            'output': writer.checkpoint()
+            })
+
+    for object in paginate(after, before, max_id, on_page, **kwargs):
+        writer.write(object)
+    writer.close()
+
+def extract_reddit_data(writer, checkpoint_file, shards=1,
+                        start=START_CREATED_UTC, end=None, resume=True, **kwargs):
+    # Hand large windows to the sharded scraper
+    if shards > 1:
+        return extract_reddit_data_sharded(writer, checkpoint_file, shards, start, end, resume, **kwargs)
+
+    # Objects created in the window (start, end] are scraped
+    before = None if end is None else end + 1
+    scrape_window(writer, checkpoint_file, start, before, resume, **kwargs)
+
+def shard_windows(start, end, shards):
+    # Split the window (start, end] into consecutive, non-overlapping windows
+    # (a, b] of roughly equal length
+    step = (end - start) / shards
+    bounds = [start + round(step * i) for i in range(shards)] + [end]
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if a < b]
+
+def merge_shards(part_files, writer, max_id=0):
+    # Each shard file is already sorted by id because paginate() only yields
+    # increasing ids, so the shards can be merged lazily by base-36 id
+    # A shard with no objects in its window never creates its file
+    files = [open(part_file, encoding="utf-8") for part_file in part_files
+             if os.path.exists(part_file)]
+    try:
+        streams = [((int(object['id'],36), object) for object in map(json.loads, file))
+                   for file in files]
+        for id, object in heapq.merge(*streams, key=lambda x: x[0]):
+            # Drop objects returned by two neighbouring shards or already
+            # written by an earlier run
+            if id <= max_id: continue
+            max_id = id
+            writer.write(object)
+    finally:
+        for file in files:
+            file.close()
+    return max_id
+
+def extract_reddit_data_sharded(writer, checkpoint_file, shards=4,
+                                start=START_CREATED_UTC, end=None, resume=True, **kwargs):
+    # The output checkpoint records the state of the output before the shards
+    # were merged into it, and the window of a run that has not finished yet
+    max_id = 0
+
+    checkpoint = load_checkpoint(checkpoint_file) if resume else None
+    if checkpoint is not None:
+        check_checkpoint(checkpoint, checkpoint_file, **kwargs)
+        start = checkpoint['max_created_utc']
+        max_id = checkpoint['max_id']
+        # An unfinished run keeps its window so its shards can be resumed
+        end = checkpoint.get('end', end)
+        # Undo a merge that was interrupted part way
+        writer.restore(checkpoint['output'])
+
+    # Default to scraping up to the current time
+    if end is None: end = int(time.time())
+
+    checkpoint = {
+        'subreddit': kwargs.get('subreddit'),
+        'type': kwargs.get('type', "comment"),
+        'max_created_utc': start,
+        'max_id': max_id,
+        'output': writer.checkpoint(),
+        'end': end
+        }
+    save_checkpoint(checkpoint_file, checkpoint)
+
+    # Each time shard is paginated by its own worker into its own temporary,
+    # uncompressed file, with its own checkpoint
+    staging_prefix = os.path.splitext(checkpoint_file)[0] + ".shard-"
+    windows = shard_windows(start, end, shards)
+    part_files = [staging_prefix + str(a) + "-" + str(b) for a, b in windows]
+
+    # Nothing to scrape when the window is empty (start >= end), e.g. a run
+    # resumed after the output was already up to date
+    if not windows:
+        del checkpoint['end']
+        save_checkpoint(checkpoint_file, checkpoint)
+        writer.close()
+        return
+
+    with ThreadPoolExecutor(max_workers=len(windows)) as executor:
+        futures = [executor.submit(scrape_window, NDJSONFile(part_file, writer.encoder),
+                                   part_file + ".checkpoint", window[0], window[1] + 1,
+                                   resume, **kwargs)
+                   for window, part_file in zip(windows, part_files)]
+        for future in futures:
+            future.result()
+
+    # Merge the shards by id with duplicates removed
+    max_id = merge_shards(part_files, writer, max_id)
+
+    # Move the cursor to the end of the window, then clean up the shards
+    del checkpoint['end']
+    checkpoint['max_created_utc'] = end
+    checkpoint['max_id'] = max_id
+    checkpoint['output'] = writer.checkpoint()
+    save_checkpoint(checkpoint_file, checkpoint)
+    writer.close()
+    for part_file in glob.glob(glob.escape(staging_prefix) + "*"):
+        os.remove(part_file)
+
+def extract_subreddits(subreddits, type="comment", max_per_host=MAX_CONNECTIONS_PER_HOST,
+                       shards=1, start=START_CREATED_UTC, end=None, resume=True,
+                       rate=REQUESTS_PER_SECOND, metrics_file=None, output_dir=None,
+                       compression="default", encoder=None, rotate_mb=256, rotate_hours=None,
+                       fields="default", filter=False, firehose=True,
+                       dedupe=True, titles_dir=None):
+    # Create the shared session and rate limiter before the workers start so
+    # that they all use the same connection pool and request budget
+    get_session(max_per_host)
+    rate_limiter = get_rate_limiter(rate)
+
+    # Each type has its own default field profile
+    if fields == "default": fields = FIELD_PROFILES[DEFAULT_PROFILES[type]]
+
+    # Comments and submissions go to separate directories by default
+    if output_dir is None: output_dir = type + "s"
+    output_dir = os.path.normpath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    encoder = get_encoder(encoder)
+
+    # Routing needs the body and the thread title, which comes from the permalink
+    if filter and fields is not None:
+        fields = list(fields) + ["body", "permalink", "link_id", "parent_id"]
+
+    # Route on the real thread titles when the submissions have been scraped
+    # (see --with-submissions), otherwise on the titles in the permalinks
+    titles = None
+    if titles_dir is None:
+        titles_dir = os.path.join(os.path.dirname(output_dir), "submissions")
+    if filter and os.path.isdir(titles_dir):
+        titles = TitleIndex.from_ndjson(titles_dir)
+        print("Loaded " + str(len(titles)) + " thread titles from " + titles_dir)
+
+    def route(comment):
+        return route_comment(comment, titles)
+
+    def open_sink(root):
+        return PartitionedSink(root, compression=compression, encoder=encoder,
+                               max_bytes=int(rotate_mb * 2 ** 20),
+                               max_seconds=None if rotate_hours is None else rotate_hours * 3600)
+
+    # Scrape every subreddit in its own worker thread
+    # The workers spend most of their time waiting on the network, so the
+    # connection pool, not the number of threads, limits the request rate
+    with ThreadPoolExecutor(max_workers=len(subreddits)) as executor:
+        futures = {}
+        for subreddit in subreddits:
+            # Each subreddit has its own sink, writing to its own partitions
+            sink = open_sink(output_dir) if firehose else None
+
+            # Route monkeypox and virus comments to their own streams as they
+            # arrive, e.g. comments_mpx/ and comments_virus/
+            if filter:
+                sink = RoutingWriter(route, {
+                    "mpx": open_sink(output_dir + "_mpx"),
+                    "virus": open_sink(output_dir + "_virus")
+                    }, everything=sink)
+
+            # Drop objects already written by this or an earlier run
+            if dedupe:
+                index = SeenIndex(os.path.join(output_dir, subreddit + "_" + type + ".seen.sqlite"))
+                sink = DedupWriter(sink, index)
+
+            checkpoint_file = os.path.join(output_dir, subreddit + "_" + type + ".checkpoint")
+            future = executor.submit(extract_reddit_data, sink, checkpoint_file,
+                                     shards=shards, start=start, end=end,
+                                     resume=resume, subreddit=subreddit, type=type,
+                                     fields=fields)
+            futures[future] = subreddit
+
+        # Report each subreddit as it finishes, re-raising any error
+        for future in as_completed(futures):
+            future.result()
+            print("Finished r/" + futures[future])
+
+    # Report the request metrics for tuning the rate limiter
+    metrics = rate_limiter.summary()
+    if resource is not None:
+        # Peak resident memory, in kilobytes on Linux (bytes on macOS)
+        metrics['peak_memory'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps(metrics, indent=2))
+    if metrics_file is not None:
+        with open(metrics_file,"w") as file:
+            json.dump(metrics, file, indent=2)
 
 # Start program by calling function with:
-# 1) Subreddit specified
+# 1) Subreddits specified (all nine by default)
 # 2) The type of data required (comment or submission)
-extract_reddit_data(subreddit="lgbt",type="comment")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape subreddits from Pushshift.")
+    parser.add_argument("subreddits", nargs="*", default=SUBREDDITS)
+    parser.add_argument("--type", default="comment", choices=["comment", "submission"])
+    parser.add_argument("--max-per-host", type=int, default=MAX_CONNECTIONS_PER_HOST)
+    parser.add_argument("--shards", type=int, default=1,
+                        help="number of time shards to paginate in parallel per subreddit")
+    parser.add_argument("--start", type=int, default=START_CREATED_UTC,
+                        help="scrape objects created after this epoch time")
+    parser.add_argument("--end", type=int, default=None,
+                        help="scrape objects created up to this epoch time (default: now)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="ignore saved checkpoints and start again from --start")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND,
+                        help="allowed number of requests per second to the Pushshift host")
+    parser.add_argument("--metrics-file", default=None,
+                        help="also write the request metrics to this JSON file")
+    parser.add_argument("--output-dir", default=None,
+                        help="directory to write the partitions to (default: comments or submissions)")
+    parser.add_argument("--compression", default="default", choices=["zstd", "gzip", "none"],
+                        help="compression of the output (default: zstd if installed, otherwise gzip)")
+    parser.add_argument("--encoder", default=None, choices=["orjson", "json"],
+                        help="JSON encoder (default: orjson if installed, otherwise json)")
+    parser.add_argument("--rotate-mb", type=float, default=256,
+                        help="start a new part file once the current one reaches this size")
+    parser.add_argument("--rotate-hours", type=float, default=None,
+                        help="start a new part file once the current one is this old")
+    parser.add_argument("--fields", default=None,
+                        help="comma-separated fields to download and keep, or a profile: " +
+                             ", ".join(FIELD_PROFILES) + " (default: condense for comments, " +
+                             "submission for submissions)")
+    parser.add_argument("--filter", action="store_true",
+                        help="also write monkeypox and virus comments to <output dir>_mpx and <output dir>_virus")
+    parser.add_argument("--no-firehose", dest="firehose", action="store_false",
+                        help="with --filter, keep only the monkeypox and virus comments")
+    parser.add_argument("--with-submissions", action="store_true",
+                        help="scrape the submissions of the same subreddits first, for their real titles")
+    parser.add_argument("--titles-dir", default=None,
+                        help="submissions to take thread titles from (default: submissions next to the output)")
+    parser.add_argument("--no-dedupe", dest="dedupe", action="store_false",
+                        help="do not check objects against the ids already written")
+    parser.add_argument("--base-url", default=PUSHSHIFT_REDDIT_URL,
+                        help="Pushshift API to scrape, e.g. a local mpx_pipeline.stand_in server")
+    args = parser.parse_args()
+    if not args.firehose and not args.filter:
+        parser.error("--no-firehose only makes sense with --filter")
+
+    PUSHSHIFT_REDDIT_URL = args.base_url.rstrip("/")
+
+    # Scrape the submissions first, so that their titles are there for the
+    # comments' keyword filter and for 04.1
+    if args.with_submissions and args.type == "comment":
+        output_dir = os.path.normpath(args.output_dir or "comments")
+        if args.titles_dir is None:
+            args.titles_dir = os.path.join(os.path.dirname(output_dir), "submissions")
+        extract_subreddits(args.subreddits, type="submission", max_per_host=args.max_per_host,
+                           shards=args.shards, start=args.start, end=args.end, resume=args.resume,
+                           rate=args.rate, output_dir=args.titles_dir,
+                           compression=None if args.compression == "none" else args.compression,
+                           encoder=args.encoder, rotate_mb=args.rotate_mb, rotate_hours=args.rotate_hours,
+                           fields=FIELD_PROFILES["submission"], dedupe=args.dedupe)
+
+    if args.fields is None:
+        fields = FIELD_PROFILES[DEFAULT_PROFILES[args.type]]
+    elif args.fields in FIELD_PROFILES:
+        fields = FIELD_PROFILES[args.fields]
+    else:
+        fields = [field.strip() for field in args.fields.split(",") if field.strip()]
+
+    extract_subreddits(args.subreddits, type=args.type, max_per_host=args.max_per_host,
+                       shards=args.shards, start=args.start, end=args.end, resume=args.resume,
+                       rate=args.rate, metrics_file=args.metrics_file, output_dir=args.output_dir,
+                       compression=None if args.compression == "none" else args.compression,
+                       encoder=args.encoder, rotate_mb=args.rotate_mb, rotate_hours=args.rotate_hours,
+                       fields=fields, filter=args.filter, firehose=args.firehose,
+                       dedupe=args.dedupe, titles_dir=args.titles_dir)
@@ -4,19 +4,88 @@ from the script "01_scrape_subreddit_comments.py" into .csv files.
 
 After each of the nine subreddits were scraped and converted into .csv files,
 the files were renamed according to their subreddit.
-Example: After scraping the r/lgbt subreddit, the file "comments.json" was 
+Example: After scraping the r/lgbt subreddit, the file "comments.json" was
 converted to "comments.csv" and renamed "lgbt_subreddit_comments_all.csv".
+
+The scraper now writes compressed, partitioned newline-delimited JSON, so the
+input is the directory of one subreddit's partitions, which are read back with
+mpx_pipeline.sinks.iter_ndjson.
+Example: For r/lgbt, the input is "comments/subreddit=lgbt".
+
+The comments are no longer loaded all at once and written to .csv. They are
+read a chunk of rows at a time and written as typed, compressed Parquet (or
+Feather, going by the extension of the output) row groups, so memory use stays
+the same whatever the size of the subreddit, and the later scripts load the
+columns with their types instead of parsing text (see
+mpx_pipeline/convert.py). Plain, gzip and zstd inputs are all accepted.
+Note: "04.1_condense_data.py" only reads the Parquet files; Feather is for
+other readers, e.g. R's arrow package.
+
+The columns are given the types declared in mpx_pipeline/schema.py (e.g.
+int64 epoch seconds for created_utc, a categorical subreddit, string bodies)
+while they are converted, and rows whose values do not fit those types are
+written to "<output>.quarantine.ndjson" instead, so the later scripts no longer
+need to check every value. Use --schema none to keep every field as it is.
+Example: For r/lgbt
+    python 02_convert_json_to_csv.py comments/subreddit=lgbt lgbt_subreddit_comments_all.parquet
+
+With --all, the files no longer need to be converted and renamed one by one:
+every subreddit in the input directory (its subreddit=<name> partitions, or a
+<name>.json file) is converted to "<name>_subreddit_comments_all.parquet" in
+the output directory, one subreddit per process, the biggest first. A summary
+of the rows, quarantined rows, sizes and times is printed and written to
+"conversion_summary.json".
+Example: To convert all nine subreddits on 8 cores
+    python 02_convert_json_to_csv.py --all comments . --workers 8
 '''
-# Import pandas library to make use of dataframe features for conversion
-import pandas as pd
+import argparse
+import os
+
+# Import the chunked NDJSON to Parquet/Feather converter
+from mpx_pipeline.convert import FORMATS, SUMMARY_FILE, convert, convert_all
+from mpx_pipeline.schema import SCHEMAS
 
-# Create variables for the input .json file and the output .csv file
-input_json_file = 'comments.json'
-output_csv_file = 'comments.csv'
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert scraped NDJSON into Parquet or Feather.")
+    parser.add_argument("input", nargs="?", default=None,
+                        help="NDJSON file or directory of partitions, plain or compressed "
+                             "(with --all: directory of subreddits, default comments)")
+    parser.add_argument("output", nargs="?", default=None,
+                        help="output file, ending in " + " or ".join(FORMATS.values()) +
+                             " (with --all: output directory, default .)")
+    parser.add_argument("--all", action="store_true",
+                        help="convert every subreddit in the input directory in parallel")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="with --all, number of processes (default: number of CPUs)")
+    parser.add_argument("--format", default="parquet", choices=list(FORMATS),
+                        help="with --all, format of the outputs (04.1_condense_data.py only "
+                             "reads parquet)")
+    parser.add_argument("--chunk-rows", type=int, default=100000,
+                        help="number of rows held in memory and written as one row group")
+    parser.add_argument("--compression", default="zstd",
+                        help="compression codec of the output, e.g. zstd, lz4, snappy or none")
+    parser.add_argument("--schema", default="comment", choices=list(SCHEMAS) + ["none"],
+                        help="declared schema to coerce the rows to, or none to infer the types")
+    args = parser.parse_args()
 
-# Use pandas to create a dataframe of the .json file
-with open( input_json_file ) as inputfile:
-    df = pd.read_json(inputfile, lines = True)
+    compression = None if args.compression == "none" else args.compression
+    schema = None if args.schema == "none" else SCHEMAS[args.schema]
 
-# Use pandas to convert dataframe into a .csv file
-df.to_csv(output_csv_file, index=False) 
\ No newline at end of file
+    if args.all:
+        summary = convert_all(args.input or "comments", args.output or ".", format=args.format,
+                              workers=args.workers, chunk_rows=args.chunk_rows, compression=compression,
+                              schema=schema)
+        print("%-20s %10s %12s %12s %12s %9s" % ("subreddit", "rows", "quarantined", "input MB", "output MB",
+                                                 "seconds"))
+        for result in summary["subreddits"] + [dict(summary["total"], subreddit="total")]:
+            print("%-20s %10d %12d %12.1f %12.1f %9.1f" % (result["subreddit"], result["rows"],
+                                                            result["quarantined"], result["input_bytes"] / 1e6,
+                                                            result["output_bytes"] / 1e6, result["seconds"]))
+        print("Summary written to", os.path.join(args.output or ".", SUMMARY_FILE))
+    else:
+        result = convert(args.input or "comments/subreddit=lgbt", args.output or "comments.parquet",
+                         chunk_rows=args.chunk_rows, compression=compression, schema=schema)
+        print("Wrote", result["rows"], "rows in", result["chunks"], "chunks to", result["output"])
+        if result["quarantined"]:
+            print("Quarantined", result["quarantined"], "rows that do not match the schema in",
+                  result["output"] + ".quarantine.ndjson")
@@ -19,6 +19,14 @@ r_NonBinary contains 132601 rows of data
 r_ftm contains 286635 rows of data
 r_BisexualTeens contains 106679 rows of data
 
+The row counts are now read in milliseconds from the manifests that
+"02_convert_json_to_csv.py" writes next to each .parquet file (or from the
+Parquet metadata if a manifest is missing or out of date), instead of loading
+several GB of comments only to count them (see mpx_pipeline/manifest.py).
+The same numbers, along with the first and last "created_utc" of each file,
+are printed by
+    python -m mpx_pipeline.manifest *_subreddit_comments_all.parquet
+
 Basic description of data collected:
     Each .csv file is titled with the subreddit the comments were obtained 
     from. These comments were extracted on the basis that they were submitted
@@ -27,41 +35,23 @@ Basic description of data collected:
     reported.
 '''
 
-# import pandas library to use dataframes
-import pandas as pd
-
-# Import all csv files 
-r_lgbt_csv = pd.read_csv( "lgbt_subreddit_comments_all.csv" )
-r_gaymers_csv = pd.read_csv( "gaymers_subreddit_comments_all.csv" )
-r_ainbow_csv = pd.read_csv( "ainbow_subreddit_comments_all.csv" )
-r_askgaybros_csv = pd.read_csv( "askgaybros_subreddit_comments_all.csv" )
-r_asktransgender_csv = pd.read_csv( "asktransgender_subreddit_comments_all.csv" )
-r_MtF_csv = pd.read_csv( "MtF_subreddit_comments_all.csv" )
-r_NonBinary_csv = pd.read_csv( "NonBinary_subreddit_comments_all.csv" )
-r_ftm_csv = pd.read_csv( "ftm_subreddit_comments_all.csv" )
-r_BisexualTeens_csv = pd.read_csv( "BisexualTeens_subreddit_comments_all.csv" )
-
-# Convert all csv files into dataframes
-r_lgbt = pd.DataFrame( r_lgbt_csv )
-r_gaymers = pd.DataFrame( r_gaymers_csv )
-r_ainbow = pd.DataFrame( r_ainbow_csv )
-r_askgaybros = pd.DataFrame( r_askgaybros_csv )
-r_asktransgender = pd.DataFrame( r_asktransgender_csv )
-r_MtF = pd.DataFrame( r_MtF_csv )
-r_NonBinary = pd.DataFrame( r_NonBinary_csv )
-r_ftm = pd.DataFrame( r_ftm_csv )
-r_BisexualTeens = pd.DataFrame( r_BisexualTeens_csv )
+# Import the reader of the datasets' manifests and metadata
+from mpx_pipeline.manifest import dataset_stats
 
 # Add the names off all the subreddits into a list called subreddits
-subreddits = [ r_lgbt, r_gaymers, r_ainbow, r_askgaybros, r_asktransgender,
-               r_MtF, r_NonBinary, r_ftm, r_BisexualTeens ]
+subreddits = [ "lgbt", "gaymers", "ainbow", "askgaybros", "asktransgender",
+               "MtF", "NonBinary", "ftm", "BisexualTeens" ]
 subreddit_str = [ "r_lgbt", "r_gaymers", "r_ainbow", "r_askgaybros", 
                   "r_asktransgender", "r_MtF", "r_NonBinary", "r_ftm", 
                   "r_BisexualTeens" ]
 
+# Look up the stats of all parquet files
+stats = [ dataset_stats( subreddit + "_subreddit_comments_all.parquet" )
+          for subreddit in subreddits ]
+
 print()
 
 # Find out the number of rows from each subreddit
 for x in range(len( subreddits )):
-    print( subreddit_str[ x ], "contains", len( subreddits[ x ]),
+    print( subreddit_str[ x ], "contains", stats[ x ][ 'rows' ],
            "rows of data")
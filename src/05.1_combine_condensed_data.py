@@ -29,91 +29,77 @@ r_NonBinary contained 24 rows of data that had a term relating to virus.
 
 There were a total of 5590 comments from the top 9 lgbt subreddits that contained a term relating to virus.
 
+The per-subreddit files are no longer loaded into dataframes and concatenated.
+Their rows are copied into the combined files as they are, and only the rows
+that "04.1_condense_data.py" has appended since the last run are added, so a
+weekly refresh only costs as much as the week's comments (see
+mpx_pipeline/combine.py). The row counts come from the condense step's
+"condense_state.json". Use --full to rebuild the combined files.
+
+With --compact, each combined file is also written as .parquet in the compact
+representation of mpx_pipeline/compact.py (categorical subreddit, author and
+thread title, boolean flags, int64 ids), which the later scripts load with a
+fraction of the memory of the .csv file.
+
+With --dataset, the combined files are not written at all. The condense step
+also writes its outputs to a dataset partitioned by subreddit, term set and
+month ("condensed_comments" in its output directory, see
+mpx_pipeline/dataset.py), which the later scripts read with
+mpx_pipeline.dataset.read_dataset, asking only for the subreddits, term set,
+months and columns they need. Combining is then only counting the rows of the
+subreddits' partitions.
+Example: To read the bodies of the monkeypox comments of the seven subreddits
+    read_dataset( "condensed_comments", "mpx", subreddits, columns=[ "body" ] )
 """
 
-# import pandas library to use dataframes
-import pandas as pd
-
-# Import all csv files that contain the monkeypox data
-lgbt_mpx_csv = pd.read_csv( "lgbt_subreddit_mpx_data.csv" )
-gaymers_mpx_cvs = pd.read_csv( "gaymers_subreddit_mpx_data.csv" )
-ainbow_mpx_cvs = pd.read_csv( "ainbow_subreddit_mpx_data.csv" )
-askgaybros_mpx_csv = pd.read_csv( "askgaybros_subreddit_mpx_data.csv" )
-asktransgender_mpx_csv = pd.read_csv( "asktransgender_subreddit_mpx_data.csv" )
-MtF_mpx_csv = pd.read_csv( "MtF_subreddit_mpx_data.csv" )
-NonBinary_mpx_csv = pd.read_csv( "NonBinary_subreddit_mpx_data.csv" )
-
-# Convert all csv files into dataframes
-lgbt_mpx = pd.DataFrame( lgbt_mpx_csv )
-gaymers_mpx = pd.DataFrame( gaymers_mpx_cvs )
-ainbow_mpx = pd.DataFrame( ainbow_mpx_cvs )
-askgaybros_mpx = pd.DataFrame( askgaybros_mpx_csv )
-asktransgender_mpx = pd.DataFrame( asktransgender_mpx_csv )
-MtF_mpx = pd.DataFrame( MtF_mpx_csv )
-NonBinary_mpx = pd.DataFrame( NonBinary_mpx_csv )
-
-# -------------------------------------------------------------------------- #
-
-# Import all csv files that contain the virus data
-lgbt_virus_csv = pd.read_csv( "lgbt_subreddit_virus_data.csv" )
-gaymers_virus_cvs = pd.read_csv( "gaymers_subreddit_virus_data.csv" )
-ainbow_virus_cvs = pd.read_csv( "ainbow_subreddit_virus_data.csv" )
-askgaybros_virus_csv = pd.read_csv( "askgaybros_subreddit_virus_data.csv" )
-asktransgender_virus_csv = pd.read_csv( "asktransgender_subreddit_virus_data.csv" )
-MtF_virus_csv = pd.read_csv( "MtF_subreddit_virus_data.csv" )
-NonBinary_virus_csv = pd.read_csv( "NonBinary_subreddit_virus_data.csv" )
-
-# Convert all csv files into dataframes
-lgbt_virus = pd.DataFrame( lgbt_virus_csv )
-gaymers_virus = pd.DataFrame( gaymers_virus_cvs )
-ainbow_virus = pd.DataFrame( ainbow_virus_cvs )
-askgaybros_virus = pd.DataFrame( askgaybros_virus_csv )
-asktransgender_virus = pd.DataFrame( asktransgender_virus_csv )
-MtF_virus = pd.DataFrame( MtF_virus_csv )
-NonBinary_virus = pd.DataFrame( NonBinary_virus_csv )
-
-# -------------------------------------------------------------------------- #
-
-# Add the names off all the subreddits into a list called subreddits
-subreddits_mpx = [ lgbt_mpx, gaymers_mpx, ainbow_mpx, askgaybros_mpx, 
-               asktransgender_mpx, MtF_mpx, NonBinary_mpx ]
-subreddit_str = [ "r_lgbt", "r_gaymers", "r_ainbow", "r_askgaybros", 
-                  "r_asktransgender", "r_MtF", "r_NonBinary" ]
-
-print()
-# Find out the number of rows from each subreddit that contained a term
-# relating to monkeypox
-for x in range(len( subreddits_mpx )):
-    print( subreddit_str[ x ], "contained", len( subreddits_mpx[ x ]),
-           "rows of data that had a term relating to monkeypox.")
-print()
-
-# Add the names off all the subreddits into a list called subreddits
-subreddits_virus = [ lgbt_virus, gaymers_virus, ainbow_virus, askgaybros_virus, 
-               asktransgender_virus, MtF_virus, NonBinary_virus ]
-subreddit_str = [ "r_lgbt", "r_gaymers", "r_ainbow", "r_askgaybros", 
-                  "r_asktransgender", "r_MtF", "r_NonBinary" ]
-
-print()
-# Find out the number of rows from each subreddit that contained a term
-# relating to monkeypox
-for x in range(len( subreddits_virus )):
-    print( subreddit_str[ x ], "contained", len( subreddits_virus[ x ]),
-           "rows of data that had a term relating to virus.")
-print()
-
-# Combine all subreddit dataframes together
-mpx_data = pd.concat( subreddits_mpx )
-virus_data = pd.concat( subreddits_virus )
-
-print( "There were a total of", len(mpx_data), 
-      "comments from the top 9 lgbt subreddits that contained a term relating to monkeypox." )
-print( "There were a total of", len(virus_data), 
-      "comments from the top 9 lgbt subreddits that contained a term relating to virus." )
-
-# Create a .csv file that contains all the data
-mpx_data.to_csv('all_subreddits_mpx_data.csv', index=False)
-virus_data.to_csv('all_subreddits_virus_data.csv', index = False)
+import argparse
+import os
+
+# Import the incremental combine step
+from mpx_pipeline.combine import combine_all, combine_dataset
+from mpx_pipeline.compact import compact_path, load_condensed, write_compact
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combine the subreddits' monkeypox and virus data.")
+    parser.add_argument("subreddits", nargs="*",
+                        default=[ "lgbt", "gaymers", "ainbow", "askgaybros", "asktransgender", "MtF", "NonBinary" ])
+    parser.add_argument("--input-dir", default=".", help="directory of the condensed .csv files")
+    parser.add_argument("--output-dir", default=".", help="directory to write the combined .csv files to")
+    parser.add_argument("--full", action="store_true", help="rebuild the combined files from scratch")
+    parser.add_argument("--dataset", nargs="?", const="condensed_comments", default=None,
+                        help="count the rows of the partitioned dataset in the input directory instead of writing "
+                             "the combined files")
+    parser.add_argument("--compact", action="store_true",
+                        help="also write the combined files as compact .parquet files")
+    args = parser.parse_args()
+
+    if args.dataset:
+        results = combine_dataset( args.subreddits, os.path.join( args.input_dir, args.dataset ) )
+    else:
+        results = combine_all( args.subreddits, args.input_dir, args.output_dir, args.full )
+    descriptions = { 'mpx': "monkeypox", 'virus': "virus" }
+
+    # Find out the number of rows from each subreddit that contained a term
+    # relating to monkeypox, and then to virus
+    for kind in [ 'mpx', 'virus' ]:
+        print()
+        for result in results[ kind ][ 'subreddits' ]:
+            message = ( "r_" + result[ 'subreddit' ] + " contained " + str( result[ 'rows' ] ) +
+                        " rows of data that had a term relating to " + descriptions[ kind ] + "." )
+            if 'new' in result:
+                message += " (" + str( result[ 'new' ] ) + " new)"
+            print( message )
+        print()
+
+    print( "There were a total of", results[ 'mpx' ][ 'rows' ],
+          "comments from the top 9 lgbt subreddits that contained a term relating to monkeypox." )
+    print( "There were a total of", results[ 'virus' ][ 'rows' ],
+          "comments from the top 9 lgbt subreddits that contained a term relating to virus." )
+
+    if args.compact and not args.dataset:
+        for kind in [ 'mpx', 'virus' ]:
+            output = results[ kind ][ 'output' ]
+            print( "Wrote", write_compact( load_condensed( output ), compact_path( output ) ) )
 
 #region MANUAL CALCULATIONS
 
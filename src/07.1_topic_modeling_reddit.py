@@ -38,9 +38,17 @@ from gensim.models import CoherenceModel
 # Initialize spaCy language model
 # Must download the spaCy model first in terminal with command: python -m spacy download en_core_web_sm
 # May need to restart IDE before loading the spaCy pipeline
+# Only the components needed for the lemmas and their parts of speech are loaded
 import importlib_metadata
+import multiprocessing
+import os
 import spacy
-nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
+from mpx_pipeline.text import LEMMA_EXCLUDE, lemmatize
+nlp = spacy.load('en_core_web_sm', exclude=LEMMA_EXCLUDE)
+
+# Number of processes for lemmatization. On Windows and macOS, where processes are not started by fork, each process
+# would run this script again, so only one is used there.
+lemmatization_processes = os.cpu_count() if multiprocessing.get_start_method() == 'fork' else 1
 
 # Load plotting tools
 import pyLDAvis.gensim_models
@@ -61,8 +69,16 @@ stop_words.extend(['ish', 'lol', 'non', 'im', 'like', 'ive', 'cant', 'amp', 'ok'
 # Load GSDMM - topic modeling for short texts (i.e., social media)
 from gsdmm import MovieGroupProcess
 
-# Import data
-mpx = pd.read_csv('data/combined_subreddits/all_subreddits_mpx_data.csv')
+# Import the text cleaning
+from mpx_pipeline.text import clean_texts
+
+# Import the comment store (see mpx_pipeline/store.py)
+from mpx_pipeline.store import CommentStore
+
+# Import data, only the columns used below. The .csv file is only parsed the first time, or after it has changed.
+store = CommentStore('data/comments.sqlite')
+store.load_csv('data/combined_subreddits/all_subreddits_mpx_data.csv', 'mpx_filtered')
+mpx = store.query('mpx_filtered', columns=['author', 'body', 'permalink'])
 
 #endregion
 
@@ -124,9 +140,11 @@ def make_trigrams(word_list):
     return [trigram_mod[bigram_mod[doc]] for doc in word_list]
 
 
-def lemmatization(word_list, allowed_postags=['NOUN', 'ADJ', 'VERB', 'ADV', 'PROPN']):
+def lemmatization(word_list, allowed_postags=['NOUN', 'ADJ', 'VERB', 'ADV', 'PROPN'], batch_size=1000,
+                  n_process=1):
     """
-    A function to lemmatize words in a list. Relies on spaCy functionality.
+    A function to lemmatize words in a list. Relies on spaCy functionality. The documents are streamed through
+    spaCy's pipeline in batches, over several processes if asked (see mpx_pipeline/text.py).
 
     Parameters
     ----------
@@ -134,19 +152,13 @@ def lemmatization(word_list, allowed_postags=['NOUN', 'ADJ', 'VERB', 'ADV', 'PRO
         A list of words that represent tokens from a list of sentences.
     allowed_postags: a list
         A list of language units to process.
+    batch_size: an integer
+        Number of documents spaCy processes at a time.
+    n_process: an integer
+        Number of processes spaCy uses.
     """
-    # Initialize an empty list
-    texts_out = []
-
-    # For everyone word in the word list
-    for word in word_list:
-
-        # Process with spaCy to lemmarize
-        doc = nlp(" ".join(word))
-        texts_out.append([token.lemma_ for token in doc if token.pos_ in allowed_postags])
-
-    # Returns a list of lemmas
-    return texts_out
+    # Returns a list of lemmas, in the order of the word list
+    return lemmatize(word_list, nlp, allowed_postags, batch_size=batch_size, n_process=n_process)
 
 
 def get_optimal_lda(dictionary, corpus, limit=30, start=2, step=2):
@@ -231,19 +243,9 @@ def top_words(cluster_word_distribution, top_cluster, values):
 # Convert text to list
 mpx_text_original = mpx['body'].values.tolist()
 
-# Remove emails, new line characters, and single quotes
-mpx_text = [re.sub('\\S*@\\S*\\s?', '', sent) for sent in mpx_text_original]
-mpx_text = [re.sub('\\s+', ' ', sent) for sent in mpx_text]
-mpx_text = [re.sub("\'", "", sent) for sent in mpx_text]
-
-# Remove markdown links with multiple words
-mpx_text = [re.sub("\\[[\\S\\s]+\\]\\(https:\\/\\/[\\D]+\\)", "", sent) for sent in mpx_text]
-
-# Remove markdown links with single words
-mpx_text = [re.sub("\\[\\w+\\]\\(https:\\/\\/[\\D\\d]+\\)", "", sent) for sent in mpx_text]
-
-# Remove urls
-mpx_text = [re.sub("https:\\/\\/[\\w\\d\\.\\/\\-\\=]+", "", sent) for sent in mpx_text]
+# Remove emails, new line characters, single quotes, markdown links and urls, in one pass over each text
+# (see mpx_pipeline/text.py)
+mpx_text = clean_texts(mpx_text_original)
 
 # Transform sentences into words, convert to list
 mpx_words = list(transform_to_words(mpx_text))
@@ -263,7 +265,7 @@ mpx_words_nostops = remove_stopwords(mpx_words)
 mpx_words_bigrams = make_bigrams(mpx_words_nostops)
 
 # Lemmatize the words, keeping nouns, adjectives, verbs, adverbs, and proper nouns
-mpx_words_lemma = lemmatization(mpx_words_bigrams)
+mpx_words_lemma = lemmatization(mpx_words_bigrams, batch_size=1000, n_process=lemmatization_processes)
 
 # Remove any stop words created in lemmatization
 mpx_words_cleaned = remove_stopwords(mpx_words_lemma)
@@ -39,8 +39,13 @@ from sentence_transformers import SentenceTransformer
 from bertopic import BERTopic
 from sklearn.feature_extraction.text import CountVectorizer
 
-# Import data
-mpx = pd.read_csv('data/combined_subreddits/all_subreddits_mpx_data.csv')
+# Import the comment store (see mpx_pipeline/store.py)
+from mpx_pipeline.store import CommentStore
+
+# Import data, only the columns used below. The .csv file is only parsed the first time, or after it has changed.
+store = CommentStore('data/comments.sqlite')
+store.load_csv('data/combined_subreddits/all_subreddits_mpx_data.csv', 'mpx_filtered')
+mpx = store.query('mpx_filtered', columns=['body', 'created_utc', 'converted_createdutc'])
 
 # Convert text to list - no need to pre-process since we are using BERT
 mpx_docs = mpx['body'].values.tolist()
@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from mpx_pipeline.condense import INPUT_NAME, OUTPUT_NAMES, condense_subreddit
+
+BODIES = ['the monkeypox vaccine is here', 'a new virus', 'I glued it with epoxy, pox on it', 'hello there',
+          'got the JYNNEOS shot']
+
+
+def comments(count):
+    return pd.DataFrame({
+        'id': ['c%d' % i for i in range(count)],
+        'author': ['author%d' % (i % 3) for i in range(count)],
+        'body': [BODIES[i % len(BODIES)] for i in range(count)],
+        'subreddit': 'lgbt',
+        'created_utc': [1651363200 + 3600 * i for i in range(count)],
+        'retrieved_utc': [1665000000] * count,
+        'permalink': ['/r/lgbt/comments/t%d/thread_%d/c%d/' % (i % 4, i % 4, i) for i in range(count)],
+        'link_id': ['t3_t%d' % (i % 4) for i in range(count)],
+        'parent_id': ['t3_t%d' % (i % 4) for i in range(count)],
+    })
+
+
+def write_input(directory, count):
+    table = pa.Table.from_pandas(comments(count), preserve_index=False)
+    pq.write_table(table, os.path.join(directory, INPUT_NAME.format(subreddit='lgbt')), row_group_size=5)
+
+
+def read_outputs(directory):
+    outputs = {}
+    for name, pattern in OUTPUT_NAMES.items():
+        with open(os.path.join(directory, pattern.format(subreddit='lgbt')), encoding='utf-8') as file:
+            outputs[name] = file.read()
+    return outputs
+
+
+def test_incremental_run_matches_a_full_run(tmp_path):
+    input_dir, incremental, full = (str(tmp_path / name) for name in ['input', 'incremental', 'full'])
+    os.makedirs(input_dir)
+
+    write_input(input_dir, 12)
+    first = condense_subreddit('lgbt', input_dir=input_dir, output_dir=incremental, chunk_rows=4)
+    write_input(input_dir, 30)
+    second = condense_subreddit('lgbt', input_dir=input_dir, output_dir=incremental, chunk_rows=4)
+    condense_subreddit('lgbt', input_dir=input_dir, output_dir=full, chunk_rows=4)
+
+    assert first['new']['comments'] == 12
+    assert second['new']['comments'] == 18
+    assert second['rows']['comments'] == 30
+    assert read_outputs(incremental) == read_outputs(full)
+    assert len(read_outputs(full)['condensed'].splitlines()) == 31
+    assert all(len(text.splitlines()) > 1 for text in read_outputs(full).values())
+
+
+def test_run_with_nothing_new_leaves_the_outputs_as_they_are(tmp_path):
+    input_dir, output_dir = str(tmp_path / 'input'), str(tmp_path / 'output')
+    os.makedirs(input_dir)
+    write_input(input_dir, 12)
+    condense_subreddit('lgbt', input_dir=input_dir, output_dir=output_dir, chunk_rows=4)
+    outputs = read_outputs(output_dir)
+
+    result = condense_subreddit('lgbt', input_dir=input_dir, output_dir=output_dir, chunk_rows=4)
+
+    assert result['new']['comments'] == 0
+    assert read_outputs(output_dir) == outputs
+
+
+def test_full_run_starts_the_outputs_over(tmp_path):
+    input_dir, output_dir = str(tmp_path / 'input'), str(tmp_path / 'output')
+    os.makedirs(input_dir)
+    write_input(input_dir, 12)
+    first = condense_subreddit('lgbt', input_dir=input_dir, output_dir=output_dir, chunk_rows=4)
+    outputs = read_outputs(output_dir)
+
+    result = condense_subreddit('lgbt', input_dir=input_dir, output_dir=output_dir, chunk_rows=4, full=True)
+
+    assert result['rows']['comments'] == 12
+    assert result['generation'] != first['generation']
+    assert read_outputs(output_dir) == outputs
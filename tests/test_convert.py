@@ -0,0 +1,66 @@
+import json
+
+import pyarrow.parquet as pq
+
+from mpx_pipeline.convert import convert, quarantine_path
+from mpx_pipeline.schema import COMMENT_SCHEMA
+
+
+def comment(reddit_id, created_utc, body='a comment'):
+    return {'id': reddit_id, 'subreddit': 'lgbt', 'created_utc': created_utc, 'body': body, 'author': 'someone'}
+
+
+def write_ndjson(path, objects):
+    with open(path, 'w', encoding='utf-8') as file:
+        for obj in objects:
+            file.write(json.dumps(obj) + '\n')
+    return str(path)
+
+
+def read_quarantine(output):
+    with open(quarantine_path(output), encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def test_rows_that_do_not_match_the_schema_are_quarantined(tmp_path):
+    path = write_ndjson(tmp_path / 'lgbt.ndjson', [
+        comment('a1', 1651363200),
+        comment('a2', 'TRUE'),
+        comment('a3', 1651363300, body=12),
+        {'id': 'a4', 'created_utc': 1651363400},
+        comment('a5', '1651363500'),
+    ])
+    output = str(tmp_path / 'lgbt.parquet')
+
+    result = convert(path, output, schema=COMMENT_SCHEMA)
+
+    assert (result['rows'], result['quarantined']) == (2, 3)
+    table = pq.read_table(output)
+    assert table.column('id').to_pylist() == ['a1', 'a5']
+    assert table.column('created_utc').to_pylist() == [1651363200, 1651363500]
+    assert [row['errors'] for row in read_quarantine(output)] == [
+        {'created_utc': 'TRUE'}, {'body': 12}, {'subreddit': 'missing'}]
+
+
+def test_chunk_with_no_row_matching_the_schema(tmp_path):
+    path = write_ndjson(tmp_path / 'lgbt.ndjson', [
+        comment('a1', 'TRUE'), comment('a2', 'FALSE'), comment('a3', 1651363200), comment('a4', 1651363300)])
+    output = str(tmp_path / 'lgbt.parquet')
+
+    result = convert(path, output, chunk_rows=2, schema=COMMENT_SCHEMA)
+
+    assert (result['rows'], result['quarantined']) == (2, 2)
+    assert pq.read_table(output).num_rows == 2
+    assert len(read_quarantine(output)) == 2
+
+
+def test_input_with_no_row_matching_the_schema(tmp_path):
+    path = write_ndjson(tmp_path / 'lgbt.ndjson', [comment('a1', 'TRUE'), comment('a2', 'FALSE')])
+    output = str(tmp_path / 'lgbt.parquet')
+
+    result = convert(path, output, chunk_rows=1, schema=COMMENT_SCHEMA)
+
+    assert (result['rows'], result['quarantined']) == (0, 2)
+    table = pq.read_table(output)
+    assert table.num_rows == 0
+    assert table.schema.names == [field.name for field in COMMENT_SCHEMA]
@@ -0,0 +1,39 @@
+import threading
+
+from mpx_pipeline.ratelimit import CircuitBreaker, RateLimiter
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+
+def responses(status_codes):
+    status_codes = iter(status_codes)
+    return lambda: Response(next(status_codes))
+
+
+def test_throttled_trial_request_is_released():
+    # Two server errors open the circuit, and the half-open trial request is throttled
+    limiter = RateLimiter(rate=100, failure_threshold=2, reset_timeout=0.2, base_delay=0.01)
+    send = responses([500, 500, 429, 200, 200])
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(response=limiter.request('comment', send)), daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+
+    assert not worker.is_alive()
+    assert result['response'].status_code == 200
+    assert limiter.breaker.state == CircuitBreaker.CLOSED
+    assert not limiter.breaker.trial_running
+
+
+def test_release_trial_lets_the_next_request_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.wait_time() == 0.0
+    assert breaker.trial_running
+    breaker.release_trial()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.wait_time() == 0.0
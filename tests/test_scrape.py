@@ -0,0 +1,143 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+from mpx_pipeline.sinks import NDJSONFile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The script's name is not a valid module name, so it is loaded from its path
+spec = importlib.util.spec_from_file_location('scraper', os.path.join(ROOT, 'src', '01_scrape_subreddit_comments.py'))
+scraper = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(scraper)
+
+
+def to_base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    text = ''
+    while number:
+        number, remainder = divmod(number, 36)
+        text = digits[remainder] + text
+    return text
+
+
+# One comment every 10 seconds, in the window (1000, 1300]
+CORPUS = [{'id': to_base36(i), 'subreddit': 'lgbt', 'created_utc': 1000 + 10 * i, 'body': 'comment %d' % i}
+          for i in range(1, 31)]
+
+PAGE_SIZE = 4
+
+
+class Pushshift:
+    """
+    Answers fetchObjects() from CORPUS, a page at a time, and fails once `fail_after` pages have been served.
+    """
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.pages = 0
+
+    def __call__(self, after, before=None, **kwargs):
+        if self.fail_after is not None and self.pages >= self.fail_after:
+            raise OSError('connection lost')
+        self.pages += 1
+        return [obj for obj in CORPUS
+                if obj['created_utc'] > after and (before is None or obj['created_utc'] < before)][:PAGE_SIZE]
+
+
+class ListWriter:
+    def __init__(self):
+        self.objects = []
+
+    def write(self, obj):
+        self.objects.append(obj)
+
+    def close(self):
+        pass
+
+
+def read_ids(path):
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line)['id'] for line in file]
+
+
+def test_resume_after_crash_writes_each_object_once(tmp_path, monkeypatch):
+    output = str(tmp_path / 'lgbt.ndjson')
+    checkpoint_file = str(tmp_path / 'lgbt_comment.checkpoint')
+
+    monkeypatch.setattr(scraper, 'fetchObjects', Pushshift(fail_after=3))
+    with pytest.raises(OSError):
+        scraper.scrape_window(NDJSONFile(output), checkpoint_file, 1000, subreddit='lgbt', type='comment')
+    # Part of a page written after the last checkpoint
+    with open(output, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(CORPUS[-1]) + '\n')
+
+    monkeypatch.setattr(scraper, 'fetchObjects', Pushshift())
+    scraper.scrape_window(NDJSONFile(output), checkpoint_file, 1000, subreddit='lgbt', type='comment')
+
+    assert read_ids(output) == [obj['id'] for obj in CORPUS]
+
+
+def test_checkpoint_of_another_subreddit_is_refused(tmp_path, monkeypatch):
+    checkpoint_file = str(tmp_path / 'lgbt_comment.checkpoint')
+    monkeypatch.setattr(scraper, 'fetchObjects', Pushshift())
+    scraper.scrape_window(NDJSONFile(str(tmp_path / 'lgbt.ndjson')), checkpoint_file, 1000, subreddit='lgbt',
+                          type='comment')
+
+    with pytest.raises(ValueError):
+        scraper.scrape_window(NDJSONFile(str(tmp_path / 'MtF.ndjson')), checkpoint_file, 1000, subreddit='MtF',
+                              type='comment')
+
+
+def test_sharded_scrape_merges_shards_in_id_order(tmp_path, monkeypatch):
+    output = str(tmp_path / 'lgbt.ndjson')
+    checkpoint_file = str(tmp_path / 'lgbt_comment.checkpoint')
+    monkeypatch.setattr(scraper, 'fetchObjects', Pushshift())
+
+    scraper.extract_reddit_data(NDJSONFile(output), checkpoint_file, shards=3, start=1000, end=1300,
+                                subreddit='lgbt', type='comment')
+
+    assert read_ids(output) == [obj['id'] for obj in CORPUS]
+    checkpoint = scraper.load_checkpoint(checkpoint_file)
+    assert checkpoint['max_created_utc'] == 1300
+    assert 'end' not in checkpoint
+    # The shards' staging files are gone
+    assert sorted(os.listdir(tmp_path)) == ['lgbt.ndjson', 'lgbt_comment.checkpoint']
+
+
+def test_merge_shards_orders_by_id_and_drops_duplicates(tmp_path):
+    parts = []
+    for name, objects in [('a', CORPUS[0:12]), ('b', CORPUS[10:20]), ('c', CORPUS[18:25])]:
+        path = str(tmp_path / name)
+        writer = NDJSONFile(path)
+        for obj in objects:
+            writer.write(obj)
+        writer.close()
+        parts.append(path)
+    # A shard whose window held no objects never creates its file
+    parts.append(str(tmp_path / 'empty'))
+
+    writer = ListWriter()
+    max_id = scraper.merge_shards(parts, writer, max_id=int(CORPUS[2]['id'], 36))
+
+    assert [obj['id'] for obj in writer.objects] == [obj['id'] for obj in CORPUS[3:25]]
+    assert max_id == int(CORPUS[24]['id'], 36)
+
+
+def test_sharded_scrape_of_an_empty_window(tmp_path, monkeypatch):
+    output = str(tmp_path / 'lgbt.ndjson')
+    checkpoint_file = str(tmp_path / 'lgbt_comment.checkpoint')
+    monkeypatch.setattr(scraper, 'fetchObjects', Pushshift())
+    scraper.extract_reddit_data(NDJSONFile(output), checkpoint_file, shards=3, start=1000, end=1300,
+                                subreddit='lgbt', type='comment')
+
+    # Resumed with nothing left to scrape
+    scraper.extract_reddit_data(NDJSONFile(output), checkpoint_file, shards=3, start=1000, end=1300,
+                                subreddit='lgbt', type='comment')
+
+    assert read_ids(output) == [obj['id'] for obj in CORPUS]
+    checkpoint = scraper.load_checkpoint(checkpoint_file)
+    assert checkpoint['max_created_utc'] == 1300
+    assert 'end' not in checkpoint
@@ -0,0 +1,46 @@
+from mpx_pipeline.seen import DedupWriter, SeenIndex, decode_id
+from mpx_pipeline.sinks import NDJSONFile, iter_ndjson
+
+
+def comment(reddit_id):
+    return {'id': reddit_id, 'subreddit': 'lgbt', 'created_utc': 1651363200}
+
+
+def open_writer(tmp_path):
+    return DedupWriter(NDJSONFile(str(tmp_path / 'comments.ndjson')), SeenIndex(str(tmp_path / 'seen.sqlite')))
+
+
+def test_objects_already_written_are_dropped_across_runs(tmp_path):
+    writer = open_writer(tmp_path)
+    for reddit_id in ['a1', 'a2', 'a1']:
+        writer.write(comment(reddit_id))
+    writer.close()
+    assert writer.skipped == 1
+
+    writer = open_writer(tmp_path)
+    for reddit_id in ['a2', 'a3']:
+        writer.write(comment(reddit_id))
+    writer.close()
+
+    assert [obj['id'] for obj in iter_ndjson(str(tmp_path / 'comments.ndjson'))] == ['a1', 'a2', 'a3']
+    assert decode_id('a3') in SeenIndex(str(tmp_path / 'seen.sqlite'))
+
+
+def test_restore_rolls_the_index_back_with_the_output(tmp_path):
+    writer = open_writer(tmp_path)
+    writer.write(comment('a1'))
+    state = writer.checkpoint()
+    writer.write(comment('a2'))
+    # A later checkpoint that the interrupted run never got to record
+    writer.checkpoint()
+    writer.writer.close()
+    writer.index.connection.close()
+
+    writer = open_writer(tmp_path)
+    writer.restore(state)
+    assert decode_id('a2') not in writer.index
+    writer.write(comment('a2'))
+    writer.close()
+
+    assert writer.skipped == 0
+    assert [obj['id'] for obj in iter_ndjson(str(tmp_path / 'comments.ndjson'))] == ['a1', 'a2']
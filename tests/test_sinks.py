@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from mpx_pipeline.sinks import NDJSONFile, PartitionedSink, iter_ndjson
+
+# 2022-05-31 and 2022-06-01, UTC
+MAY = 1654041599
+JUNE = 1654041600
+
+
+def comment(number, created_utc):
+    return {'id': str(number), 'subreddit': 'lgbt', 'created_utc': created_utc, 'body': 'comment %d' % number}
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_partitioned_sink_restore_undoes_writes_after_the_checkpoint(tmp_path, compression):
+    root = str(tmp_path / 'comments')
+    # Every object is its own frame, and every frame after the first starts a new part
+    sink = PartitionedSink(root, compression=compression, buffer_bytes=1, max_bytes=1)
+    before = [comment(i, MAY - i) for i in range(3)]
+    after = [comment(i, MAY - i) for i in range(3, 5)] + [comment(i, JUNE + i) for i in range(5, 8)]
+    for obj in before:
+        sink.write(obj)
+    state = sink.checkpoint()
+    for obj in after:
+        sink.write(obj)
+    sink.flush()
+
+    # The run is interrupted, and the next one restores the checkpoint and writes the same objects again
+    sink = PartitionedSink(root, compression=compression, buffer_bytes=1, max_bytes=1)
+    sink.restore(state)
+    for obj in after:
+        sink.write(obj)
+    sink.close()
+
+    assert sorted(obj['id'] for obj in iter_ndjson(root)) == sorted(obj['id'] for obj in before + after)
+    assert sorted(os.listdir(os.path.join(root, 'subreddit=lgbt'))) == ['month=2022-05', 'month=2022-06']
+
+
+def test_partitioned_sink_carries_on_with_the_last_part(tmp_path):
+    root = str(tmp_path / 'comments')
+    sink = PartitionedSink(root, compression='gzip')
+    sink.write(comment(1, MAY))
+    sink.close()
+
+    sink = PartitionedSink(root, compression='gzip')
+    sink.write(comment(2, MAY))
+    sink.close()
+
+    assert os.listdir(os.path.join(root, 'subreddit=lgbt', 'month=2022-05')) == ['part-00000.ndjson.gz']
+    assert [obj['id'] for obj in iter_ndjson(root)] == ['1', '2']
+
+
+def test_ndjson_file_restore_truncates_to_the_checkpoint(tmp_path):
+    path = str(tmp_path / 'shard.ndjson')
+    writer = NDJSONFile(path)
+    writer.write(comment(1, MAY))
+    state = writer.checkpoint()
+    writer.write(comment(2, MAY))
+    writer.close()
+
+    writer = NDJSONFile(path)
+    writer.restore(state)
+    writer.write(comment(3, MAY))
+    writer.close()
+
+    assert [obj['id'] for obj in iter_ndjson(path)] == ['1', '3']
@@ -0,0 +1,25 @@
+import pandas as pd
+
+from mpx_pipeline.store import CommentStore
+
+# Monday 2022-07-18 00:00 UTC
+MONDAY = 1658102400
+
+
+def test_weeks_start_on_monday(tmp_path):
+    path = tmp_path / 'lgbt_condensed.csv'
+    pd.DataFrame({
+        'subreddit': ['lgbt'] * 3,
+        'author': ['a', 'b', 'c'],
+        'body': ['sunday night', 'monday morning', 'sunday again'],
+        'created_utc': [MONDAY - 1, MONDAY, MONDAY + 7 * 86400 - 1],
+    }).to_csv(path, index=False)
+    store = CommentStore(str(tmp_path / 'comments.sqlite'))
+    store.load_csv(str(path), 'all')
+
+    weeks = store.time_series(frequency='week')
+    store.close()
+
+    assert list(weeks.index) == [pd.Timestamp('2022-07-11', tz='UTC'), pd.Timestamp('2022-07-18', tz='UTC')]
+    assert list(weeks['lgbt']) == [1, 2]
+    assert all(week.dayofweek == 0 for week in weeks.index)